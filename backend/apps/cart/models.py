@@ -1,19 +1,52 @@
-from django.db import models
+from decimal import Decimal
+from django.db import connection, models
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from django.utils.functional import cached_property
 from apps.authentication.models import User
 from apps.products.models import Product
 
+
+def line_total():
+    """quantity * Product.current_price of a cart item, as an SQL expression"""
+    price = Coalesce(NullIf('product__discount_price', models.Value(0)), 'product__price')
+    return models.ExpressionWrapper(
+        price * models.F('quantity'), output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def for_user(cls, user):
+        """
+        The user's cart, created on first use with INSERT ... ON CONFLICT DO NOTHING
+        so concurrent first requests neither fail nor create two carts.
+        """
+        cart = cls.objects.filter(user=user).first()
+        if cart is None:
+            cls.objects.bulk_create([cls(user=user)], ignore_conflicts=True)
+            cart = cls.objects.get(user=user)
+        return cart
+
+    @cached_property
+    def totals(self):
+        """Total amount and item count in a single aggregate query"""
+        return self.items.aggregate(
+            total_amount=models.Sum(line_total(), default=Decimal('0')),
+            total_items=models.Sum('quantity', default=0),
+        )
+
     @property
     def total_amount(self):
-        return sum([item.subtotal for item in self.items.all()])
+        return self.totals['total_amount']
 
     @property
     def total_items(self):
-        return sum([item.quantity for item in self.items.all()])
+        return self.totals['total_items']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -23,7 +56,37 @@ class CartItem(models.Model):
 
     @property
     def subtotal(self):
+        # Annotated by the cart loader, so serializing items never loads products one by one
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.product.current_price * self.quantity
 
     class Meta:
         unique_together = ('cart', 'product')
+
+    @classmethod
+    def add_quantities(cls, cart_id, quantities):
+        """
+        Add {product_id: quantity} to a cart, inserting missing items. Each row is a
+        single INSERT ... ON CONFLICT DO UPDATE, so concurrent adds never lose an update.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} (cart_id, product_id, quantity, created_at) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity'
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = [(cart_id, product_id, quantity, now) for product_id, quantity in quantities.items()]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    @classmethod
+    def set_quantities(cls, cart_id, quantities):
+        """Set {product_id: quantity} in a cart in one bulk upsert; a quantity of 0 removes the item"""
+        removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if removed:
+            cls.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+        cls.objects.bulk_create(
+            [cls(cart_id=cart_id, product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items() if quantity > 0],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
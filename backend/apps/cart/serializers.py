@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
+from apps.products.fieldsets import SparseFieldsetMixin
+from apps.products.models import Product
 from apps.products.serializers import ProductListSerializer
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ['product']
     product = ProductListSerializer(read_only=True)
     subtotal = serializers.ReadOnlyField()
 
@@ -10,7 +13,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ('id', 'product', 'quantity', 'subtotal')
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_amount = serializers.ReadOnlyField()
     total_items = serializers.ReadOnlyField()
@@ -18,3 +21,23 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ('id', 'items', 'total_amount', 'total_items')
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, default=1, min_value=0)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Must be at least 1 when adding.'})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_operations(self, operations):
+        product_ids = {operation['product_id'] for operation in operations}
+        missing = product_ids - set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(f'Products not found: {sorted(missing)}')
+        return operations
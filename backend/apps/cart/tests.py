@@ -1,3 +1,195 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from django.core.signals import request_started
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from apps.authentication.models import User
+from apps.products.local_index import warm_up
+from apps.products.models import Brand, Category, Product, ProductImage
+from .models import Cart, CartItem
+from .views import fold_operations
 
-# Create your tests here.
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+    """Concurrent add_to_cart calls against one cart must all be counted"""
+    THREADS = 8
+    ADDS_PER_THREAD = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Shared-cache in-memory SQLite fails concurrent writers instead of making them wait
+            self.skipTest('needs a test database that several connections can share')
+        self.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='secret')
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='Acme')
+        self.products = [
+            Product.objects.create(name=f'Speaker {i}', description='-', price=100, category=category, brand=brand)
+            for i in range(2)
+        ]
+
+    def add_concurrently(self, quantity):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(index):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            product = self.products[index % len(self.products)]
+            try:
+                barrier.wait()
+                for _ in range(self.ADDS_PER_THREAD):
+                    response = client.post('/api/cart/add/', {'product_id': product.id, 'quantity': quantity}, format='json')
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_concurrent_adds_lose_no_updates(self):
+        errors = self.add_concurrently(quantity=2)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        per_product = self.THREADS // len(self.products) * self.ADDS_PER_THREAD * 2
+        quantities = dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {product.id: per_product for product in self.products})
+
+
+class CartTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Keep the catalog's background index builds away from the test database
+        request_started.disconnect(warm_up, dispatch_uid='local_index_warm_up')
+
+    def setUp(self):
+        self.user = User.objects.create(username='shopper', email='shopper@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.cart = Cart.for_user(self.user)
+
+    def product(self, name, price, discount_price=None):
+        return Product.objects.create(
+            name=name, description='-', price=price, discount_price=discount_price, category=self.category, brand=self.brand
+        )
+
+
+class CartTotalsTests(CartTestCase):
+    def test_totals_use_the_current_price(self):
+        CartItem.objects.create(cart=self.cart, product=self.product('Speaker', 100, 80), quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.product('Cable', 10, 0), quantity=3)
+
+        data = self.client.get('/api/cart/').json()
+
+        self.assertEqual(Decimal(data['total_amount']), Decimal('190'))
+        self.assertEqual(data['total_items'], 5)
+        self.assertEqual(sorted(Decimal(item['subtotal']) for item in data['items']), [Decimal('30'), Decimal('160')])
+
+    def test_empty_cart(self):
+        data = self.client.get('/api/cart/').json()
+
+        self.assertEqual((Decimal(data['total_amount']), data['total_items'], data['items']), (0, 0, []))
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def add_items(count):
+            for i in range(count):
+                product = self.product(f'Speaker {CartItem.objects.count()}', 100)
+                ProductImage.objects.create(product=product, image=f'products/{product.pk}.jpg')
+                CartItem.objects.create(cart=self.cart, product=product)
+
+        add_items(1)
+        # Cart, items with their products, images, totals
+        with self.assertNumQueries(4):
+            self.client.get('/api/cart/')
+        add_items(10)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.client.get('/api/cart/').json()['items']), 11)
+
+    def test_sparse_fields_skip_the_items(self):
+        CartItem.objects.create(cart=self.cart, product=self.product('Speaker', 100))
+
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/cart/', {'fields': 'total_amount,total_items'}).json()
+        self.assertEqual(data, {'total_amount': 100, 'total_items': 1})
+
+
+class FoldOperationsTests(SimpleTestCase):
+    def fold(self, *operations):
+        return fold_operations([{'op': op, 'product_id': pk, 'quantity': quantity} for op, pk, quantity in operations])
+
+    def test_adds_become_increments(self):
+        self.assertEqual(self.fold(('add', 1, 2), ('add', 1, 3), ('add', 2, 1)), ({1: 5, 2: 1}, {}))
+
+    def test_set_and_remove_fix_the_quantity(self):
+        self.assertEqual(self.fold(('add', 1, 2), ('set', 1, 4)), ({}, {1: 4}))
+        self.assertEqual(self.fold(('add', 1, 2), ('remove', 1, 1)), ({}, {1: 0}))
+
+    def test_adds_after_a_set_add_to_it(self):
+        self.assertEqual(self.fold(('set', 1, 4), ('add', 1, 2), ('remove', 2, 1), ('add', 2, 3)), ({}, {1: 6, 2: 3}))
+
+
+class BatchUpdateCartTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.speaker, self.cable, self.amp = [self.product(name, 100) for name in ('Speaker', 'Cable', 'Amp')]
+        CartItem.objects.create(cart=self.cart, product=self.speaker, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.cable, quantity=2)
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product__name', 'quantity'))
+
+    def test_operations_are_applied_together(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.speaker.id, 'quantity': 2},
+            {'op': 'remove', 'product_id': self.cable.id},
+            {'op': 'set', 'product_id': self.amp.id, 'quantity': 4},
+            {'op': 'add', 'product_id': self.amp.id},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {'Speaker': 3, 'Amp': 5})
+        self.assertEqual(response.json()['cart']['total_items'], 8)
+
+    def test_set_to_zero_removes(self):
+        self.batch({'op': 'set', 'product_id': self.cable.id, 'quantity': 0})
+
+        self.assertEqual(self.quantities(), {'Speaker': 1})
+
+    def test_invalid_batches_change_nothing(self):
+        for operations in [
+            [{'op': 'add', 'product_id': self.amp.id}, {'op': 'add', 'product_id': 999}],
+            [{'op': 'add', 'product_id': self.amp.id, 'quantity': 0}],
+            [{'op': 'clear', 'product_id': self.amp.id}],
+            [],
+        ]:
+            self.assertEqual(self.batch(*operations).status_code, 400, operations)
+        self.assertEqual(self.quantities(), {'Speaker': 1, 'Cable': 2})
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        operations = [{'op': 'add', 'product_id': self.amp.id}] * 10 + [{'op': 'set', 'product_id': self.speaker.id, 'quantity': 3}]
+        with CaptureQueriesContext(connection) as small:
+            self.batch(operations[0], operations[-1])
+        with CaptureQueriesContext(connection) as large:
+            self.batch(*operations)
+
+        self.assertEqual(len(large), len(small))
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.batch({'op': 'add', 'product_id': self.amp.id}).status_code, 401)
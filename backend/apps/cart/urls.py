@@ -6,4 +6,5 @@ urlpatterns = [
     path('add/', views.add_to_cart, name='add-to-cart'),
     path('update/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove-from-cart'),
+    path('batch/', views.batch_update_cart, name='batch-update-cart'),
 ]
@@ -2,45 +2,69 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import Cart, CartItem
-from .serializers import CartSerializer
+from .models import Cart, CartItem, line_total
+from .serializers import CartBatchSerializer, CartSerializer
 from apps.products.models import Product
+from apps.products.fieldsets import PRODUCT_LIST_PLAN, is_requested, plan_lookups
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+# Relations of a cart item, relative to CartItem; joined into the items query where possible
+CART_ITEM_PLAN = [('items.product', 'select', 'product', None)] + [
+    (f'items.product.{path}', kind, f'product__{lookup}', field)
+    for path, kind, lookup, field in PRODUCT_LIST_PLAN
+]
+
+
+def load_cart(request, cart):
+    """
+    Load everything CartSerializer renders for this request: the totals in one
+    aggregate, and the items joined with their products, categories and brands
+    plus one query for images. The query count does not depend on the cart size.
+    """
+    if is_requested(request, 'items'):
+        select, prefetch = plan_lookups(request, CART_ITEM_PLAN)
+        items = CartItem.objects.annotate(line_total=line_total()).select_related(*select).prefetch_related(*prefetch)
+        prefetch_related_objects([cart], Prefetch('items', queryset=items))
+    return cart
+
+
+def cart_data(request, cart):
+    return CartSerializer(load_cart(request, cart), context={'request': request}).data
+
 
 class CartView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+        return load_cart(self.request, Cart.for_user(self.request.user))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_to_cart(request):
     product_id = request.data.get('product_id')
-    quantity = request.data.get('quantity', 1)
-
     try:
-        product = Product.objects.get(id=product_id)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        quantity = int(request.data.get('quantity', 1))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity < 1:
+        return Response({'error': 'Quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'message': 'Product added to cart',
-            'cart': CartSerializer(cart).data
-        })
-    except Product.DoesNotExist:
+    try:
+        product = Product.objects.only('id').get(id=product_id)
+    except (Product.DoesNotExist, ValueError, TypeError):
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    # One upsert: double clicks and retries add up instead of racing on unique_together
+    cart = Cart.for_user(request.user)
+    CartItem.add_quantities(cart.id, {product.id: quantity})
+
+    return Response({
+        'message': 'Product added to cart',
+        'cart': cart_data(request, cart)
+    })
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_cart_item(request, item_id):
@@ -57,7 +81,7 @@ def update_cart_item(request, item_id):
         
         return Response({
             'message': 'Cart updated',
-            'cart': CartSerializer(cart_item.cart).data
+            'cart': cart_data(request, cart_item.cart)
         })
     except CartItem.DoesNotExist:
         return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -71,3 +95,51 @@ def remove_from_cart(request, item_id):
         return Response({'message': 'Item removed from cart'})
     except CartItem.DoesNotExist:
         return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+
+def fold_operations(operations):
+    """
+    Reduce a list of cart operations to (increments, quantities) per product.
+    Products that are only added to become increments, applied relative to
+    whatever the cart holds; a set or remove fixes the quantity, and later
+    adds of the same product are added to it.
+    """
+    increments, quantities = {}, {}
+    for operation in operations:
+        product_id, quantity = operation['product_id'], operation['quantity']
+        if operation['op'] == 'add':
+            if product_id in quantities:
+                quantities[product_id] += quantity
+            else:
+                increments[product_id] = increments.get(product_id, 0) + quantity
+        else:
+            increments.pop(product_id, None)
+            quantities[product_id] = quantity if operation['op'] == 'set' else 0
+    return increments, quantities
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    """
+    Apply a list of operations to the cart in one transaction and return the
+    resulting cart once:
+
+        {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+                        {"op": "set", "product_id": 2, "quantity": 5},
+                        {"op": "remove", "product_id": 3}]}
+
+    A set to 0 removes the item. Nothing is applied if any operation is invalid.
+    """
+    serializer = CartBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    increments, quantities = fold_operations(serializer.validated_data['operations'])
+    with transaction.atomic():
+        cart = Cart.for_user(request.user)
+        CartItem.set_quantities(cart.id, quantities)
+        CartItem.add_quantities(cart.id, increments)
+
+    return Response({
+        'message': 'Cart updated',
+        'cart': cart_data(request, cart)
+    })
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 from .models import Order, OrderItem
+from apps.products.fieldsets import SparseFieldsetMixin
 from apps.products.serializers import ProductListSerializer
 from apps.authentication.serializers import AddressSerializer
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ['product']
     product = ProductListSerializer(read_only=True)
     subtotal = serializers.ReadOnlyField()
 
@@ -11,7 +13,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ('id', 'product', 'quantity', 'price', 'subtotal')
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ['items', 'shipping_address']
     items = OrderItemSerializer(many=True, read_only=True)
     shipping_address = AddressSerializer(read_only=True)
 
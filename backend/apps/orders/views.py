@@ -5,21 +5,29 @@ from rest_framework.response import Response
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, CreateOrderSerializer
 from apps.cart.models import Cart
+from apps.products.fieldsets import apply_plan, nested_product_plan
 from apps.authentication.models import Address
 
+ORDER_PLAN = [
+    ('shipping_address', 'select', 'shipping_address', None),
+    ('items', 'prefetch', 'items', None),
+] + nested_product_plan('items.product', 'items__product')
+
+
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return apply_plan(queryset, self.request, ORDER_PLAN)
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return apply_plan(Order.objects.filter(user=self.request.user), self.request, ORDER_PLAN)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.products'
+
+    def ready(self):
+        from django.core.signals import request_finished, request_started
+        from . import signals  # noqa: F401
+        from .cache import forget_versions, remember_versions
+        from .local_index import warm_up
+        request_started.connect(warm_up, dispatch_uid='local_index_warm_up')
+        request_started.connect(remember_versions, dispatch_uid='catalog_version_remember')
+        request_finished.connect(forget_versions, dispatch_uid='catalog_version_forget')
@@ -0,0 +1,82 @@
+"""
+Filtering and facets on ProductAttribute name/value pairs.
+
+    attr[color]=red&attr[size]=M,L
+
+Values of one attribute are OR-ed, different attributes are AND-ed. Names and
+values are matched on their normalized keys (ProductAttribute.name_key and
+value_key), so each attribute becomes one semi-join that is answered from the
+(name_key, value_key, product) index.
+
+Attribute facets are disjunctive: the counts for a selected attribute ignore
+that attribute's own filter, so the other values stay selectable. That takes
+one grouped query, plus one per selected attribute.
+"""
+import re
+from collections import defaultdict
+from django.db.models import Count, Min
+from .models import ProductAttribute
+
+ATTRIBUTE_PARAM = re.compile(r'^attr\[(.+)\]$')
+
+
+def parse_attribute_filters(params):
+    """{name_key: [value_key, ...]} from attr[...] query parameters"""
+    filters = defaultdict(list)
+    for key in params:
+        match = ATTRIBUTE_PARAM.match(key)
+        if not match:
+            continue
+        name_key = ProductAttribute.normalize_name(match.group(1))
+        for raw in params.getlist(key):
+            for value in raw.split(','):
+                value_key = ProductAttribute.normalize_value(value)
+                if name_key and value_key and value_key not in filters[name_key]:
+                    filters[name_key].append(value_key)
+    return {name_key: values for name_key, values in filters.items() if values}
+
+
+def filter_by_attributes(queryset, filters):
+    for name_key, value_keys in filters.items():
+        matching = ProductAttribute.objects.filter(name_key=name_key, value_key__in=value_keys)
+        queryset = queryset.filter(id__in=matching.values('product_id'))
+    return queryset
+
+
+class AttributeFilterBackend:
+    """DRF filter backend applying attr[...] parameters"""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_by_attributes(queryset, parse_attribute_filters(request.query_params))
+
+
+def _value_counts(queryset, **lookups):
+    return ProductAttribute.objects.filter(
+        product_id__in=queryset.order_by().values('id'), **lookups
+    ).values('name_key', 'value_key').annotate(
+        name=Min('name'), value=Min('value'), count=Count('product_id', distinct=True)
+    ).order_by()
+
+
+def attribute_facets(queryset, filters):
+    """
+    Attribute facets for a queryset that is filtered by everything except the
+    attribute filters.
+    """
+    rows = list(_value_counts(filter_by_attributes(queryset, filters)).exclude(name_key__in=list(filters)))
+    for name_key in filters:
+        others = {key: values for key, values in filters.items() if key != name_key}
+        rows.extend(_value_counts(filter_by_attributes(queryset, others), name_key=name_key))
+
+    facets = {}
+    for row in rows:
+        facet = facets.setdefault(row['name_key'], {'name': row['name'], 'key': row['name_key'], 'values': []})
+        facet['values'].append({
+            'value': row['value'],
+            'key': row['value_key'],
+            'count': row['count'],
+            'selected': row['value_key'] in filters.get(row['name_key'], []),
+        })
+    for facet in facets.values():
+        facet['values'].sort(key=lambda item: (-item['count'], item['key']))
+    return sorted(facets.values(), key=lambda facet: facet['key'])
@@ -0,0 +1,117 @@
+"""
+In-process prefix index for search-as-you-type suggestions.
+
+Product, brand and category names are normalized (lowercase, accents and
+punctuation stripped) and every word-suffix of a name becomes a key, so
+"gal" finds "Samsung Galaxy S24". Keys live in one sorted list per kind and
+a query is a bisect into that list plus a top-N walk over a segment tree, so
+even one-letter prefixes cost O(N log n). Entries are ranked by weight:
+popularity for products, products_count for brands and categories.
+
+The index is kept in process memory and refreshed on catalog changes by
+LocalIndex (see local_index.py).
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+from .local_index import LocalIndex, normalize
+from .models import Brand, Category, Product
+
+MAX_SUGGESTIONS = 20
+MAX_WORDS = 6
+
+
+def word_suffixes(key):
+    words = key.split()
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORDS))]
+
+
+class PrefixIndex:
+    """
+    Sorted word-suffix keys of (name, weight, payload) entries. A prefix
+    matches a contiguous range of keys; a segment tree holding the best-ranked
+    key of every subtree yields that range's top entries in O(limit * log n).
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        pairs = sorted(
+            (key, i) for i, (name, _, _) in enumerate(entries) for key in word_suffixes(normalize(name))
+        )
+        self.keys = [key for key, _ in pairs]
+        self.refs = array('L', [i for _, i in pairs])
+
+        # Rank 0 is the best entry: highest weight, then shortest name
+        order = sorted(range(len(entries)), key=lambda i: (-entries[i][1], len(entries[i][0]), entries[i][0]))
+        self.entry_rank = array('L', [0] * len(entries))
+        for rank, i in enumerate(order):
+            self.entry_rank[i] = rank
+
+        self.size = 1
+        while self.size < len(pairs):
+            self.size *= 2
+        missing = len(entries)
+        ranks = [self.entry_rank[i] for i in self.refs] + [missing] * (self.size - len(pairs))
+        tree = [missing] * self.size + ranks
+        for node in range(self.size - 1, 0, -1):
+            tree[node] = min(tree[2 * node], tree[2 * node + 1])
+        self.tree = array('L', tree)
+        self.order = array('L', order)
+
+    def search(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+
+        # Best-first walk from the canonical nodes covering [start, end)
+        heap = []
+        low, high = start + self.size, end + self.size
+        while low < high:
+            if low & 1:
+                heap.append((self.tree[low], low))
+                low += 1
+            if high & 1:
+                high -= 1
+                heap.append((self.tree[high], high))
+            low //= 2
+            high //= 2
+        heapq.heapify(heap)
+
+        matches = []
+        while heap and len(matches) < limit:
+            rank, node = heapq.heappop(heap)
+            if node >= self.size:
+                if not matches or matches[-1] != rank:
+                    matches.append(rank)
+            else:
+                heapq.heappush(heap, (self.tree[2 * node], 2 * node))
+                heapq.heappush(heap, (self.tree[2 * node + 1], 2 * node + 1))
+        return [self.entries[self.order[rank]][2] for rank in matches]
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self.kinds = {
+            'products': PrefixIndex([
+                (name, popularity, {'id': pk, 'name': name, 'slug': slug})
+                for pk, name, slug, popularity in Product.objects.filter(is_active=True)
+                .values_list('id', 'name', 'slug', 'popularity').iterator()
+            ]),
+            'brands': PrefixIndex([
+                (name, count, {'id': pk, 'name': name, 'slug': slug})
+                for pk, name, slug, count in Brand.objects.filter(is_active=True)
+                .values_list('id', 'name', 'slug', 'products_count')
+            ]),
+            'categories': PrefixIndex([
+                (name, count, {'id': pk, 'name': name, 'slug': slug})
+                for pk, name, slug, count in Category.objects.filter(is_active=True)
+                .values_list('id', 'name', 'slug', 'products_count')
+            ]),
+        }
+
+    def suggest(self, query, limit=5):
+        prefix = normalize(query)
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        return {kind: index.search(prefix, limit) if prefix else [] for kind, index in self.kinds.items()}
+
+
+autocomplete_index = LocalIndex(AutocompleteIndex, 'autocomplete-index')
@@ -0,0 +1,203 @@
+"""
+Versioned response cache for the public catalog endpoints.
+
+Cached entries are keyed by a catalog version number that is bumped after any
+catalog write commits, so a single increment invalidates every cached catalog
+response at once and stale entries simply age out of the backend. The backend
+is the `catalog` entry in settings.CACHES (local memory, file based or Redis).
+The version itself is a CatalogVersion row, so processes that do not share
+the cache backend still agree on it. It is read from the primary; a response
+computed on a replica that has not yet replicated that version is served but
+not cached, so lagging data is never stored under a newer version.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from rest_framework.response import Response
+from ecommerce_project.replicas import current_replica
+from .models import CatalogVersion
+
+CATALOG_CACHE_ALIAS = 'catalog'
+
+
+def get_catalog_cache():
+    if CATALOG_CACHE_ALIAS in settings.CACHES:
+        return caches[CATALOG_CACHE_ALIAS]
+    return caches['default']
+
+
+# The version read by the request this thread is serving, see remember_versions()
+_request = threading.local()
+
+
+def remember_versions(**kwargs):
+    """request_started receiver: read the catalog version at most once per request"""
+    _request.active, _request.version = True, None
+
+
+def forget_versions(**kwargs):
+    """request_finished receiver"""
+    _request.active, _request.version = False, None
+
+
+def get_catalog_version():
+    version = getattr(_request, 'version', None)
+    if version is not None:
+        return version
+    version = CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    if version is None:
+        # Seed from the clock so a recreated row never rewinds to a version that is still cached
+        version = CatalogVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns() // 1000})[0].version
+    if getattr(_request, 'active', False):
+        _request.version = version
+    return version
+
+
+def replica_is_current(version):
+    """Whether the replica this request reads from, if any, has replicated the catalog up to version"""
+    replica = current_replica()
+    if replica is None:
+        return True
+    return CatalogVersion.objects.using(replica).filter(pk=1, version__gte=version).exists()
+
+
+def bump_catalog_version():
+    _request.version = None
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        get_catalog_version()
+
+
+def bump_catalog_version_on_commit(**kwargs):
+    """Signal receiver: invalidate cached catalog responses once the write is committed"""
+    transaction.on_commit(bump_catalog_version)
+
+
+def request_digest(request):
+    query = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    # Payloads hold absolute URLs, so the scheme and host are part of the key
+    raw = f'{request.build_absolute_uri(request.path)}?{query}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def catalog_cache_key(request, version=None):
+    if version is None:
+        version = get_catalog_version()
+    return f'catalog:response:{version}:{request_digest(request)}'
+
+
+def stale_cache_key(request):
+    """Unversioned key holding the last computed (version, data), served while a recompute runs"""
+    return f'catalog:response:stale:{request_digest(request)}'
+
+
+# Keys being recomputed in this process -> Event set when the computation ends
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def cached_response(data, status):
+    response = Response(data)
+    response['X-Cache'] = status
+    return response
+
+
+def stale_response(stale):
+    version, data = stale
+    response = cached_response(data, 'STALE')
+    # An ETag of its own keeps clients from storing stale data under the current collection ETag
+    response['ETag'] = f'W/"stale-{version}"'
+    return response
+
+
+def wait_for(cache, key, timeout):
+    """Poll the cache for key until another process stores it; None on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return None
+
+
+def cache_catalog_response(view_func):
+    """
+    Cache the response data of a public GET catalog view under the current
+    catalog version. Works on DRF function views (below @api_view) and on
+    view methods through method_decorator.
+
+    Misses are coalesced so a version bump does not send every concurrent
+    request to the database. Within a process one thread (the leader)
+    computes a key while the others wait for its result; across processes
+    the leader also takes a short lock in the catalog cache, and losers poll
+    for the result. While a key is recomputed, waiters get the last data
+    computed for the same request (X-Cache: STALE), which is kept for
+    CATALOG_CACHE_STALE_SECONDS beyond the cache timeout. Responses marked
+    Cache-Control: no-store (e.g. error fallbacks) are not stored.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view_func(request, *args, **kwargs)
+
+        cache = get_catalog_cache()
+        version = get_catalog_version()
+        key, stale_key = catalog_cache_key(request, version), stale_cache_key(request)
+        cached = cache.get_many([key, stale_key])
+        if key in cached:
+            return cached_response(cached[key], 'HIT')
+        stale = cached.get(stale_key)
+        lock_timeout = getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 10)
+
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = threading.Event()
+        if not leader:
+            if stale is not None:
+                return stale_response(stale)
+            flight.wait(lock_timeout)
+            data = cache.get(key)
+            if data is not None:
+                return cached_response(data, 'HIT')
+            # The leader failed or timed out; compute without caching
+            return view_func(request, *args, **kwargs)
+
+        lock_key = f'{key}:lock'
+        locked = False
+        try:
+            locked = cache.add(lock_key, 1, lock_timeout)
+            if not locked:
+                if stale is not None:
+                    return stale_response(stale)
+                data = wait_for(cache, key, lock_timeout)
+                if data is not None:
+                    return cached_response(data, 'HIT')
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                if replica_is_current(version) and 'no-store' not in response.get('Cache-Control', ''):
+                    stale_timeout = cache.default_timeout
+                    if stale_timeout is not None:
+                        stale_timeout += getattr(settings, 'CATALOG_CACHE_STALE_SECONDS', 60)
+                    cache.set(key, response.data)
+                    cache.set(stale_key, (version, response.data), stale_timeout)
+                response['X-Cache'] = 'MISS'
+            return response
+        finally:
+            if locked:
+                cache.delete(lock_key)
+            with _flights_lock:
+                del _flights[key]
+            flight.set()
+    return wrapper
@@ -0,0 +1,78 @@
+"""
+Lean "card" projection of products for listing pages.
+
+A card carries only what a product tile shows: the primary image and its
+thumbnail URL, the category and brand id/name/slug, and price, discount and
+rating fields taken from stored columns. Rows come from one values() query
+(the primary image is a correlated subquery) and are shaped with plain dict
+building instead of nested serializers. Request it with `?view=card`.
+"""
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+from rest_framework.response import Response
+from .models import ProductImage
+
+# Includes every ordering field of the list views, which cursor pagination reads from the rows
+CARD_VALUES = [
+    'id', 'name', 'slug', 'price', 'discount_price', 'stock_quantity', 'featured', 'created_at', 'popularity',
+    'rating_sum', 'review_count',
+    'category_id', 'category__name', 'category__slug',
+    'brand_id', 'brand__name', 'brand__slug',
+]
+
+
+def card_queryset(queryset):
+    primary_images = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'id')
+    return queryset.select_related(None).prefetch_related(None).annotate(
+        primary_image=Subquery(primary_images.values('image')[:1]),
+        primary_image_thumbnail=Subquery(primary_images.values('image_info__renditions__thumbnail')[:1]),
+    ).values(*CARD_VALUES, 'primary_image', 'primary_image_thumbnail')
+
+
+def storage_url(name, request=None):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def product_card(row, request=None):
+    price = row['price']
+    discount_price = row['discount_price']
+    image, thumbnail = [
+        storage_url(row[key], request) for key in ('primary_image', 'primary_image_thumbnail')
+    ]
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'slug': row['slug'],
+        'price': price,
+        'discount_price': discount_price,
+        'current_price': discount_price if discount_price else price,
+        'discount_percentage': int(((price - discount_price) / price) * 100) if discount_price and price else 0,
+        'average_rating': row['rating_sum'] / row['review_count'] if row['review_count'] else 0,
+        'review_count': row['review_count'],
+        'stock_quantity': row['stock_quantity'],
+        'featured': row['featured'],
+        'image': image,
+        'thumbnail': thumbnail,
+        'category': {'id': row['category_id'], 'name': row['category__name'], 'slug': row['category__slug']},
+        'brand': {'id': row['brand_id'], 'name': row['brand__name'], 'slug': row['brand__slug']},
+    }
+
+
+class ProductCardListMixin:
+    """List view mixin that serves the card projection when `view=card` is requested"""
+    card_param = 'view'
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.card_param) != 'card':
+            return super().list(request, *args, **kwargs)
+
+        queryset = card_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [product_card(row, request) for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
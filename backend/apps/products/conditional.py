@@ -0,0 +1,64 @@
+"""
+Validators for conditional GET (ETag / Last-Modified) on catalog endpoints.
+
+Detail validators come from a single values() query over the timestamps and
+counters that feed the serialized payload, so a revalidation that ends in 304
+never serializes anything. Image and attribute changes touch
+Product.updated_at, and review and counter updates stamp updated_at as well.
+The bulk popularity refresh does not, so popularity is a validator field.
+List endpoints use a collection ETag derived from the catalog version.
+"""
+import hashlib
+from django.views.decorators.http import condition
+from .cache import get_catalog_version
+from .models import Category, Product
+
+PRODUCT_VALIDATOR_FIELDS = [
+    'updated_at', 'rating_sum', 'review_count', 'popularity',
+    'category__updated_at', 'category__products_count', 'category__parent__updated_at',
+    'brand__updated_at', 'brand__products_count',
+]
+CATEGORY_VALIDATOR_FIELDS = ['updated_at', 'products_count', 'parent__updated_at']
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def row_validators(request, model, fields, slug):
+    """(etag, last_modified) for one active object, memoized on the request"""
+    cache_attr = f'_{model._meta.model_name}_validators'
+    if not hasattr(request, cache_attr):
+        row = model.objects.filter(slug=slug, is_active=True).values_list(*fields).first()
+        validators = (None, None)
+        if row is not None:
+            timestamps = [value for field, value in zip(fields, row) if field.endswith('updated_at') and value]
+            # The query string is part of the tag because fields=/omit=/expand= change the payload
+            validators = (make_etag(model.__name__, request.get_full_path(), *row), max(timestamps))
+        setattr(request, cache_attr, validators)
+    return getattr(request, cache_attr)
+
+
+def product_etag(request, slug, **kwargs):
+    return row_validators(request, Product, PRODUCT_VALIDATOR_FIELDS, slug)[0]
+
+
+def product_last_modified(request, slug, **kwargs):
+    return row_validators(request, Product, PRODUCT_VALIDATOR_FIELDS, slug)[1]
+
+
+def category_etag(request, slug, **kwargs):
+    return row_validators(request, Category, CATEGORY_VALIDATOR_FIELDS, slug)[0]
+
+
+def category_last_modified(request, slug, **kwargs):
+    return row_validators(request, Category, CATEGORY_VALIDATOR_FIELDS, slug)[1]
+
+
+def collection_etag(request, *args, **kwargs):
+    return make_etag(get_catalog_version(), request.build_absolute_uri())
+
+
+product_condition = condition(etag_func=product_etag, last_modified_func=product_last_modified)
+category_condition = condition(etag_func=category_etag, last_modified_func=category_last_modified)
+collection_condition = condition(etag_func=collection_etag)
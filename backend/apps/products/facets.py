@@ -0,0 +1,138 @@
+"""
+Facet counts for a filtered product result set.
+
+Every facet is computed with a fixed number of aggregate queries over the
+filtered queryset, no matter how many categories or brands match:
+categories (3), brands (2), price range and stock (1), price buckets (1),
+attributes (1 + one per attr[...] filter, see attributes.py).
+"""
+import hashlib
+import math
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Count, Max, Min, Q
+from django.utils.http import urlencode
+from .attributes import attribute_facets, filter_by_attributes, parse_attribute_filters
+from .cache import get_catalog_cache, get_catalog_version, replica_is_current
+from .models import Brand, Category, CategoryClosure
+
+PRICE_BUCKETS = 5
+
+# Query parameters that change paging or ordering but not the result set
+IGNORED_PARAMS = {'page', 'page_size', 'cursor', 'pagination', 'include_count', 'ordering'}
+
+
+def facet_cache_key(params, version):
+    """Cache key for a filter set, independent of parameter order and paging"""
+    normalized = sorted(
+        (key, value)
+        for key in params
+        if key not in IGNORED_PARAMS
+        for value in sorted(params.getlist(key))
+        if value != ''
+    )
+    digest = hashlib.sha1(urlencode(normalized).encode()).hexdigest()
+    return f'product_facets:{version}:{digest}'
+
+
+def nice_step(span, buckets):
+    """Round span / buckets up to 1, 2, 2.5 or 5 times a power of ten"""
+    raw = span / buckets
+    if raw <= 0:
+        return Decimal(1)
+    magnitude = Decimal(10) ** math.floor(math.log10(raw))
+    for factor in (1, 2, Decimal('2.5'), 5, 10):
+        if magnitude * factor >= raw:
+            return magnitude * factor
+
+
+def price_buckets(queryset, min_price, max_price):
+    if min_price is None:
+        return []
+    step = nice_step(float(max_price - min_price), PRICE_BUCKETS)
+    low = (min_price // step) * step
+    bounds = []
+    while low <= max_price:
+        bounds.append((low, low + step))
+        low += step
+
+    counts = queryset.aggregate(**{
+        f'bucket_{i}': Count('id', filter=Q(price__gte=lo, price__lt=hi))
+        for i, (lo, hi) in enumerate(bounds)
+    })
+    return [
+        {'min': lo, 'max': hi, 'count': counts[f'bucket_{i}']}
+        for i, (lo, hi) in enumerate(bounds)
+    ]
+
+
+def compute_facets(queryset, attribute_filters=None):
+    """
+    Category, brand, price, stock and attribute facets. queryset is filtered by
+    everything except attribute_filters, which are applied here so attribute
+    facets can leave out their own filter.
+    """
+    from .serializers import BrandSerializer, CategorySerializer
+
+    attribute_filters = attribute_filters or {}
+    base = queryset.order_by()
+    queryset = filter_by_attributes(base, attribute_filters)
+
+    # Categories roll up through the closure table, matching category_slug filtering.
+    # The rollup happens in Python because the filtered queryset may already join the closure table.
+    direct_counts = dict(queryset.values_list('category_id').annotate(count=Count('id')))
+    category_counts = defaultdict(int)
+    links = CategoryClosure.objects.filter(descendant_id__in=direct_counts).values_list('ancestor_id', 'descendant_id')
+    for ancestor_id, descendant_id in links:
+        category_counts[ancestor_id] += direct_counts[descendant_id]
+    categories = Category.objects.filter(id__in=category_counts, is_active=True).select_related('parent').order_by('name')
+
+    brand_counts = dict(queryset.values_list('brand_id').annotate(count=Count('id')))
+    brands = Brand.objects.filter(id__in=brand_counts, is_active=True).order_by('name')
+
+    stats = queryset.aggregate(
+        min_price=Min('price'),
+        max_price=Max('price'),
+        total=Count('id'),
+        in_stock=Count('id', filter=Q(stock_quantity__gt=0)),
+    )
+
+    category_data = CategorySerializer(categories, many=True).data
+    for item in category_data:
+        item['count'] = category_counts[item['id']]
+    brand_data = BrandSerializer(brands, many=True).data
+    for item in brand_data:
+        item['count'] = brand_counts[item['id']]
+
+    return {
+        'categories': category_data,
+        'brands': brand_data,
+        'price_range': {
+            'min_price': stats['min_price'] or 0,
+            'max_price': stats['max_price'] or 0,
+        },
+        'price_buckets': price_buckets(queryset, stats['min_price'], stats['max_price']),
+        'availability': {
+            'in_stock': stats['in_stock'],
+            'out_of_stock': stats['total'] - stats['in_stock'],
+        },
+        'attributes': attribute_facets(base, attribute_filters),
+        'total': stats['total'],
+    }
+
+
+def get_facets(params, get_queryset):
+    """
+    compute_facets() cached per normalized filter set and catalog version.
+    get_queryset builds the queryset filtered by everything except attr[...]
+    and is only called on a cache miss.
+    """
+    cache = get_catalog_cache()
+    version = get_catalog_version()
+    key = facet_cache_key(params, version)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(get_queryset(), parse_attribute_filters(params))
+        if replica_is_current(version):
+            cache.set(key, facets)
+    return facets
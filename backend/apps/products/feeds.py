@@ -0,0 +1,150 @@
+"""
+Streaming product feeds (Google Merchant-style RSS/XML and CSV).
+
+Products are read with QuerySet.iterator(chunk_size=...) together with their
+category, brand and images, turned into flat feed items and written out as a
+generator of text chunks, so memory stays constant however large the catalog
+is. The same generators back the HTTP feed (StreamingHttpResponse) and the
+export_catalog command (file output); both can gzip the stream on the fly.
+
+With `since`, the feed only contains products whose updated_at is later,
+including deactivated ones. The feed is public, so those are reported with
+only their id and as out of stock, which is all partners need to withdraw
+them, and nothing of a product that was never released leaks out.
+"""
+import csv
+import zlib
+from datetime import datetime, time
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Product, ProductImage
+
+FEED_FORMATS = ('xml', 'csv')
+CSV_COLUMNS = [
+    'id', 'title', 'description', 'link', 'image_link', 'additional_image_link', 'availability',
+    'price', 'sale_price', 'brand', 'product_type', 'condition', 'updated_at',
+]
+MAX_ADDITIONAL_IMAGES = 10
+
+
+def parse_since(value):
+    """Parse an ISO date or datetime; naive values are taken in the current time zone"""
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'invalid date: {value!r}')
+        since = datetime.combine(day, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def feed_queryset(since=None):
+    queryset = Product.objects.select_related('category__parent', 'brand').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.only('id', 'product_id', 'image', 'is_primary'))
+    ).order_by('id')
+    if since is not None:
+        return queryset.filter(updated_at__gt=since)
+    return queryset.filter(is_active=True)
+
+
+def absolute_url(base_url, path):
+    if path.startswith(('http://', 'https://')) or not base_url:
+        return path
+    return base_url.rstrip('/') + path
+
+
+def format_price(amount):
+    return f'{amount} {settings.PRODUCT_FEED_CURRENCY}'
+
+
+def withdrawn_item(product):
+    item = dict.fromkeys(CSV_COLUMNS, '')
+    item.update(id=product.id, additional_image_link=[], availability='out_of_stock')
+    return item
+
+
+def feed_items(queryset, base_url='', chunk_size=None):
+    """Yield one flat dict per product, keyed by CSV_COLUMNS"""
+    chunk_size = chunk_size or settings.PRODUCT_FEED_CHUNK_SIZE
+    for product in queryset.iterator(chunk_size=chunk_size):
+        if not product.is_active:
+            yield withdrawn_item(product)
+            continue
+        images = sorted(product.images.all(), key=lambda image: (not image.is_primary, image.id))
+        image_links = [absolute_url(base_url, default_storage.url(image.image.name)) for image in images]
+        category = product.category
+        product_type = f'{category.parent.name} > {category.name}' if category.parent_id else category.name
+        in_stock = product.stock_quantity > 0
+        yield {
+            'id': product.id,
+            'title': product.name,
+            'description': product.short_description or product.description,
+            'link': settings.PRODUCT_FEED_LINK.format(slug=product.slug),
+            'image_link': image_links[0] if image_links else '',
+            'additional_image_link': image_links[1:MAX_ADDITIONAL_IMAGES + 1],
+            'availability': 'in_stock' if in_stock else 'out_of_stock',
+            'price': format_price(product.price),
+            'sale_price': format_price(product.discount_price) if product.discount_price else '',
+            'brand': product.brand.name,
+            'product_type': product_type,
+            'condition': 'new',
+            'updated_at': product.updated_at.isoformat(),
+        }
+
+
+def xml_chunks(items, title='Product feed', link=''):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+        f'<title>{escape(title)}</title>\n<link>{escape(link)}</link>\n'
+    )
+    for item in items:
+        lines = ['<item>']
+        for key in CSV_COLUMNS:
+            values = item[key] if isinstance(item[key], list) else [item[key]]
+            lines.extend(f'<g:{key}>{escape(str(value))}</g:{key}>' for value in values if value != '')
+        lines.append('</item>\n')
+        yield '\n'.join(lines)
+    yield '</channel>\n</rss>\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for item in items:
+        yield writer.writerow([
+            ','.join(item[key]) if isinstance(item[key], list) else item[key] for key in CSV_COLUMNS
+        ])
+
+
+def render_feed(feed_format, items, **kwargs):
+    if feed_format == 'xml':
+        return xml_chunks(items, **kwargs)
+    return csv_chunks(items)
+
+
+def encode_chunks(chunks, compress=False):
+    """Encode text chunks as UTF-8, optionally as a gzip stream"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
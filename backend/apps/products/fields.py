@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class FullTextDocumentField(models.TextField):
+    """
+    The hidden column of an SQLite FTS5 table, which has the same name as the
+    table itself. Supports `__match` to run an FTS5 MATCH query against it.
+    """
+
+
+@FullTextDocumentField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
@@ -0,0 +1,143 @@
+"""
+Sparse fieldsets for API responses, driven by three query parameters:
+
+    fields=id,name,category.name   keep only these fields (per nesting level)
+    omit=description,images        drop these fields
+    expand=category,items.product  expand only these relations; every other
+                                   expandable relation collapses to its id
+                                   (or is dropped for to-many relations)
+
+Paths are dotted through nested serializers. Without any of the parameters
+the full graph is returned. Views use is_included() to build a
+select_related/prefetch_related plan that matches the pruned serializer.
+"""
+from rest_framework import serializers
+
+
+def _param(request, name):
+    if request is None:
+        return []
+    return [value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()]
+
+
+def _level(entries, prefix):
+    """Entries relative to the serializer at prefix"""
+    if not prefix:
+        return entries
+    start = prefix + '.'
+    return [entry[len(start):] for entry in entries if entry.startswith(start)]
+
+
+def is_requested(request, path):
+    """Whether fields=/omit= keep the field at the dotted path"""
+    fields, omit = _param(request, 'fields'), _param(request, 'omit')
+    segments = path.split('.')
+    for i, segment in enumerate(segments):
+        prefix = '.'.join(segments[:i])
+        selected = [entry.split('.')[0] for entry in _level(fields, prefix)]
+        if selected and segment not in selected:
+            return False
+        if segment in _level(omit, prefix):
+            return False
+    return True
+
+
+def is_expanded(request, path):
+    """Whether expand= (if given) expands the relation at the dotted path"""
+    expand = _param(request, 'expand')
+    if not expand:
+        return True
+    return any(entry == path or entry.startswith(path + '.') for entry in expand)
+
+
+def is_included(request, path):
+    """
+    Whether the relation at path is serialized in full, i.e. needs to be loaded.
+    Expanding a nested path implies expanding its parents, so only the last
+    segment is checked against expand=.
+    """
+    segments = path.split('.')
+    return all(
+        is_requested(request, '.'.join(segments[:i + 1])) for i in range(len(segments))
+    ) and is_expanded(request, path)
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin applying fields=/omit=/expand= from the request in the
+    serializer context. Relations listed in `expandable_fields` take part in expand=.
+    """
+    expandable_fields = []
+
+    def get_path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                parts.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(parts))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+
+        path = self.get_path()
+        for name in list(fields):
+            full_path = f'{path}.{name}' if path else name
+            if not is_requested(request, full_path):
+                del fields[name]
+            elif name in self.expandable_fields and not is_expanded(request, full_path):
+                if isinstance(fields[name], serializers.ListSerializer):
+                    del fields[name]
+                else:
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, source=fields[name].source)
+        return fields
+
+
+def plan_lookups(request, plan):
+    """
+    Split a query plan into (select_related, prefetch_related) lookups, keeping
+    only the relations that will be serialized. plan is a list of
+    (relation path, 'select' | 'prefetch', lookup, field) tuples; when field is
+    set, the lookup is only needed if that field of the relation is requested.
+    """
+    select, prefetch = [], []
+    for path, kind, lookup, field in plan:
+        if not is_included(request, path):
+            continue
+        if field and not is_requested(request, f'{path}.{field}'):
+            continue
+        (select if kind == 'select' else prefetch).append(lookup)
+    return select, prefetch
+
+
+def apply_plan(queryset, request, plan):
+    select, prefetch = plan_lookups(request, plan)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+PRODUCT_LIST_PLAN = [
+    ('category', 'select', 'category', None),
+    ('category', 'select', 'category__parent', 'parent_name'),
+    ('brand', 'select', 'brand', None),
+    ('images', 'prefetch', 'images', None),
+]
+
+PRODUCT_DETAIL_PLAN = PRODUCT_LIST_PLAN + [
+    ('attributes', 'prefetch', 'attributes', None),
+]
+
+
+def nested_product_plan(path, lookup):
+    """PRODUCT_LIST_PLAN for products reached through a to-many relation, as prefetches"""
+    return [(path, 'prefetch', lookup, None)] + [
+        (f'{path}.{sub_path}', 'prefetch', f'{lookup}__{sub_lookup}', field)
+        for sub_path, _, sub_lookup, field in PRODUCT_LIST_PLAN
+    ]
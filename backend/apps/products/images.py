@@ -0,0 +1,170 @@
+"""
+Image derivative pipeline.
+
+When a ProductImage, Category image or Brand logo is saved, the upload is
+processed on a small background thread pool: it is measured, its dominant
+color is taken, and a fixed set of WebP renditions is written next to it in
+storage. The result is stored in the model's `<field>_info` JSON column:
+
+    {"source": "products/x.jpg", "width": 1200, "height": 900,
+     "dominant_color": "#a0b1c2", "renditions": {"thumbnail": "derivatives/products/x_thumbnail.webp", ...}}
+
+Set IMAGE_PIPELINE_SYNC = True to process inline (e.g. in tests or scripts).
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# name -> (width, height, crop); cropped renditions fill the box exactly
+RENDITIONS = {
+    'thumbnail': (200, 200, True),
+    'card': (480, 480, False),
+    'large': (1200, 1200, False),
+}
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+# (app label, model name) -> image field names processed by the pipeline
+IMAGE_FIELDS = {
+    ('products', 'ProductImage'): ['image'],
+    ('products', 'Category'): ['image'],
+    ('products', 'Brand'): ['logo'],
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2),
+            thread_name_prefix='image-pipeline'
+        )
+    return _executor
+
+
+def rendition_name(source, rendition):
+    stem, _ = os.path.splitext(source)
+    return f'derivatives/{stem}_{rendition}.webp'
+
+
+def dominant_color(image):
+    red, green, blue = image.convert('RGB').resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def build_derivatives(source):
+    """Create the WebP renditions for a stored image and return its info dict"""
+    with default_storage.open(source) as handle:
+        image = ImageOps.exif_transpose(Image.open(handle))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    renditions = {}
+    for name, (width, height, crop) in RENDITIONS.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = ImageOps.contain(image, (width, height), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        path = rendition_name(source, name)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        renditions[name] = default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    return {
+        'source': source,
+        'width': image.width,
+        'height': image.height,
+        'dominant_color': dominant_color(image),
+        'renditions': renditions,
+    }
+
+
+def delete_renditions(info):
+    for path in info['renditions'].values():
+        default_storage.delete(path)
+
+
+def process_image_field(model_label, pk, field_name):
+    """Build derivatives for one image field and store them without firing save signals"""
+    from . import object_cache
+    from .cache import bump_catalog_version
+    model = apps.get_model(model_label)
+    obj = model.objects.filter(pk=pk).first()
+    source = getattr(obj, field_name).name if obj else None
+    if not source:
+        return None
+    info = build_derivatives(source)
+    updates = {f'{field_name}_info': info}
+    if model_label != 'products.ProductImage':
+        # Categories and brands carry their own validators; product images touch their product below
+        updates['updated_at'] = timezone.now()
+    # Matches nothing if the object was deleted or got another image while the renditions were built
+    if not model.objects.filter(pk=pk, **{field_name: source}).update(**updates):
+        delete_renditions(info)
+        return None
+    if model_label == 'products.ProductImage':
+        apps.get_model('products', 'Product').touch(obj.product_id)
+        object_cache.invalidate_products(pk=obj.product_id)
+    else:
+        object_cache.invalidate(model._meta.model_name, [obj.slug])
+    bump_catalog_version()
+    return info
+
+
+def process_in_background(model_label, pk, field_name):
+    """Executor job for process_image_field; nothing waits on its result, so failures are logged here"""
+    try:
+        process_image_field(model_label, pk, field_name)
+    except Exception:
+        logger.exception('Could not build image derivatives for %s %s (%s)', model_label, pk, field_name)
+    finally:
+        connection.close()
+
+
+def needs_processing(instance, field_name):
+    name = getattr(instance, field_name).name
+    info = getattr(instance, f'{field_name}_info') or {}
+    return bool(name) and info.get('source') != name
+
+
+def schedule(instance, field_name):
+    """Queue derivative generation once the current transaction commits"""
+    model_label = instance._meta.label
+
+    def submit():
+        if getattr(settings, 'IMAGE_PIPELINE_SYNC', False):
+            process_image_field(model_label, instance.pk, field_name)
+        else:
+            get_executor().submit(process_in_background, model_label, instance.pk, field_name)
+
+    transaction.on_commit(submit)
+
+
+def image_info_urls(info, request=None):
+    """Public representation of an `<field>_info` value with absolute rendition URLs"""
+    if not info:
+        return None
+    renditions = {}
+    for name, path in info.get('renditions', {}).items():
+        url = default_storage.url(path)
+        renditions[name] = request.build_absolute_uri(url) if request is not None else url
+    return {
+        'width': info.get('width'),
+        'height': info.get('height'),
+        'dominant_color': info.get('dominant_color'),
+        'renditions': renditions,
+    }
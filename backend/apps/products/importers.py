@@ -0,0 +1,398 @@
+"""
+Streaming bulk import of catalog data from CSV or JSONL.
+
+Rows are read lazily and written with bulk_create/bulk_update in batches,
+one transaction per batch. After every committed batch the number of
+consumed rows is written to a checkpoint file next to the source, so an
+interrupted import can resume where it stopped. Bulk writes bypass
+Model.save(), so derived data (category closure table, product counters,
+search index, catalog version) is rebuilt once at the end. Image and
+attribute batches stamp Product.updated_at of the products they touch.
+
+Rows reference related objects by slug: a category's `parent`, a product's
+`category` and `brand`, and an image's or attribute's `product`. Parent
+categories must appear before their children.
+"""
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+from decimal import Decimal, InvalidOperation
+from io import StringIO
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from . import object_cache
+from .cache import bump_catalog_version
+from .models import Brand, Category, CategoryClosure, Product, ProductAttribute, ProductImage
+from .search import get_search_backend
+
+
+class ImportRowError(Exception):
+    pass
+
+
+def reconcile_counts():
+    """Recompute the stored brand and category product counters, which bulk writes leave behind"""
+    call_command('reconcile_catalog_counts', stdout=StringIO())
+
+
+def read_rows(path, fmt=None):
+    """Yield rows of a CSV or JSONL file as dicts, one at a time"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_bool(value, default=False):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def parse_decimal(value, field, required=True):
+    if value is None or value == '':
+        if required:
+            raise ImportRowError(f'{field} is required')
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ImportRowError(f'invalid {field}: {value!r}')
+
+
+def parse_int(value, field, default=0):
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f'invalid {field}: {value!r}')
+
+
+class SlugResolver:
+    """slug -> id lookups with an in-memory cache, including misses"""
+
+    def __init__(self, model, preload=False):
+        self.model = model
+        self.cache = {}
+        if preload:
+            self.cache.update(model.objects.values_list('slug', 'id').iterator())
+
+    def add(self, slug, pk):
+        self.cache[slug] = pk
+
+    def resolve_many(self, slugs):
+        missing = {slug for slug in slugs if slug and slug not in self.cache}
+        if missing:
+            found = dict(self.model.objects.filter(slug__in=missing).values_list('slug', 'id'))
+            for slug in missing:
+                self.cache[slug] = found.get(slug)
+
+    def get(self, slug, field):
+        pk = self.cache.get(slug) if slug else None
+        if pk is None:
+            raise ImportRowError(f'unknown {field} {slug!r}')
+        return pk
+
+
+class SlugAllocator:
+    """Hands out unique slugs for new rows, checked against the database up front"""
+
+    def __init__(self, model):
+        self.taken = set(model.objects.values_list('slug', flat=True).iterator())
+
+    def allocate(self, wanted):
+        base = slugify(wanted) or 'item'
+        slug, n = base, 2
+        while slug in self.taken:
+            slug, n = f'{base}-{n}', n + 1
+        self.taken.add(slug)
+        return slug
+
+
+class BaseImporter(ABC):
+    model = None
+
+    def __init__(self, update=False):
+        self.update = update
+
+    @abstractmethod
+    def build(self, row):
+        """Return a model instance for a row, or raise ImportRowError"""
+
+    def prepare(self, rows):
+        """Hook to batch-resolve references before build() runs on each row"""
+
+    def write(self, objects):
+        self.model.objects.bulk_create(objects)
+        return objects
+
+    def finalize(self):
+        """Rebuild derived data once all batches are committed"""
+
+
+class SluggedImporter(BaseImporter):
+    """Creates new rows, or with update=True updates rows whose slug already exists"""
+    update_fields = []
+    unique_name = False
+
+    def __init__(self, update=False):
+        super().__init__(update)
+        self.slugs = SlugAllocator(self.model)
+        self.existing = SlugResolver(self.model, preload=update)
+        self.names = set(self.model.objects.values_list('name', flat=True).iterator()) if self.unique_name else None
+
+    def assign_slug(self, obj, row):
+        slug = (row.get('slug') or '').strip()
+        if self.update and slug and self.existing.cache.get(slug):
+            obj.pk = self.existing.cache[slug]
+            obj.slug = slug
+            obj._state.adding = False
+        else:
+            if self.names is not None:
+                if obj.name in self.names:
+                    raise ImportRowError(f'duplicate name {obj.name!r}')
+                self.names.add(obj.name)
+            obj.slug = self.slugs.allocate(slug or obj.name)
+        return obj
+
+    def write(self, objects):
+        new = [obj for obj in objects if obj._state.adding]
+        changed = [obj for obj in objects if not obj._state.adding]
+        self.model.objects.bulk_create(new)
+        if changed:
+            # bulk_update() skips auto_now, and updated_at feeds the conditional GET validators
+            now = timezone.now()
+            for obj in changed:
+                obj.updated_at = now
+            self.model.objects.bulk_update(changed, self.update_fields + ['updated_at'])
+        for obj in new:
+            self.existing.add(obj.slug, obj.pk)
+        return objects
+
+
+class BrandImporter(SluggedImporter):
+    model = Brand
+    update_fields = ['name', 'description', 'is_active']
+    unique_name = True
+
+    def build(self, row):
+        if not row.get('name'):
+            raise ImportRowError('name is required')
+        brand = Brand(name=row['name'], description=row.get('description') or '', is_active=parse_bool(row.get('is_active'), True))
+        return self.assign_slug(brand, row)
+
+    def finalize(self):
+        bump_catalog_version()
+        object_cache.invalidate_all()
+
+
+class CategoryImporter(SluggedImporter):
+    model = Category
+    update_fields = ['name', 'description', 'parent', 'is_active', 'sort_order']
+    unique_name = True
+
+    def prepare(self, rows):
+        self.existing.resolve_many(row.get('parent') for row in rows)
+        self.pending = set()
+
+    def build(self, row):
+        if not row.get('name'):
+            raise ImportRowError('name is required')
+        parent = (row.get('parent') or '').strip()
+        if parent and not self.existing.cache.get(parent) and parent not in self.pending:
+            raise ImportRowError(f'unknown parent {parent!r}')
+        category = Category(
+            name=row['name'],
+            description=row.get('description') or '',
+            is_active=parse_bool(row.get('is_active'), True),
+            sort_order=parse_int(row.get('sort_order'), 'sort_order'),
+        )
+        category._parent_slug = parent
+        self.assign_slug(category, row)
+        self.pending.add(category.slug)
+        return category
+
+    def write(self, objects):
+        # Parents may be created in the same batch, so link them after the insert
+        super().write(objects)
+        for obj in objects:
+            obj.parent_id = self.existing.get(obj._parent_slug, 'parent') if obj._parent_slug else None
+        self.model.objects.bulk_update(objects, ['parent'])
+        return objects
+
+    def finalize(self):
+        CategoryClosure.rebuild()
+        # Moved subtrees carry their products to other ancestors
+        reconcile_counts()
+        bump_catalog_version()
+        object_cache.invalidate_all()
+
+
+class ProductImporter(SluggedImporter):
+    model = Product
+    update_fields = [
+        'name', 'description', 'short_description', 'price', 'discount_price',
+        'category', 'brand', 'stock_quantity', 'is_active', 'featured',
+    ]
+
+    def __init__(self, update=False):
+        super().__init__(update)
+        self.categories = SlugResolver(Category, preload=True)
+        self.brands = SlugResolver(Brand, preload=True)
+
+    def build(self, row):
+        if not row.get('name'):
+            raise ImportRowError('name is required')
+        product = Product(
+            name=row['name'],
+            description=row.get('description') or '',
+            short_description=row.get('short_description') or '',
+            price=parse_decimal(row.get('price'), 'price'),
+            discount_price=parse_decimal(row.get('discount_price'), 'discount_price', required=False),
+            category_id=self.categories.get(row.get('category'), 'category'),
+            brand_id=self.brands.get(row.get('brand'), 'brand'),
+            stock_quantity=parse_int(row.get('stock_quantity'), 'stock_quantity'),
+            is_active=parse_bool(row.get('is_active'), True),
+            featured=parse_bool(row.get('featured')),
+        )
+        return self.assign_slug(product, row)
+
+    def finalize(self):
+        reconcile_counts()
+        get_search_backend().rebuild()
+        bump_catalog_version()
+        object_cache.invalidate_all()
+
+
+class ProductChildImporter(BaseImporter):
+    """Images and attributes: rows point at their product by slug"""
+
+    def __init__(self, update=False):
+        super().__init__(update)
+        self.products = SlugResolver(Product)
+
+    def prepare(self, rows):
+        self.products.resolve_many(row.get('product') for row in rows)
+
+    def write(self, objects):
+        super().write(objects)
+        # Product.updated_at feeds the conditional GET validators, as Product.touch() does for single saves
+        product_ids = {obj.product_id for obj in objects}
+        Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+        return objects
+
+    def finalize(self):
+        bump_catalog_version()
+        object_cache.invalidate_all()
+
+
+class ProductImageImporter(ProductChildImporter):
+    model = ProductImage
+
+    def build(self, row):
+        if not row.get('image'):
+            raise ImportRowError('image is required')
+        return ProductImage(
+            product_id=self.products.get(row.get('product'), 'product'),
+            image=row['image'],
+            alt_text=row.get('alt_text') or '',
+            is_primary=parse_bool(row.get('is_primary')),
+        )
+
+
+class ProductAttributeImporter(ProductChildImporter):
+    model = ProductAttribute
+
+    def build(self, row):
+        if not row.get('name'):
+            raise ImportRowError('name is required')
+        attribute = ProductAttribute(
+            product_id=self.products.get(row.get('product'), 'product'),
+            name=row['name'],
+            value=row.get('value') or '',
+        )
+        attribute.set_keys()
+        return attribute
+
+
+IMPORTERS = {
+    'brands': BrandImporter,
+    'categories': CategoryImporter,
+    'products': ProductImporter,
+    'images': ProductImageImporter,
+    'attributes': ProductAttributeImporter,
+}
+
+
+class Checkpoint:
+    """Number of source rows already committed, persisted next to the source file"""
+
+    def __init__(self, source, entity):
+        self.path = f'{source}.{entity}.checkpoint'
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as handle:
+            return json.load(handle)['rows']
+
+    def save(self, rows):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump({'rows': rows}, handle)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_import(importer, rows, batch_size, skip=0, on_batch=None, on_error=None):
+    """
+    Import rows in batches of batch_size, skipping the first `skip` rows.
+    on_batch(consumed, written) runs after each commit; on_error(row_number, error)
+    for each rejected row. Returns (consumed, written, rejected).
+    """
+    consumed = written = rejected = 0
+    batch = []
+
+    def flush():
+        nonlocal written, rejected
+        importer.prepare([row for _, row in batch])
+        objects = []
+        for number, row in batch:
+            try:
+                objects.append(importer.build(row))
+            except ImportRowError as e:
+                rejected += 1
+                if on_error:
+                    on_error(number, e)
+        with transaction.atomic():
+            importer.write(objects)
+        written += len(objects)
+        batch.clear()
+        if on_batch:
+            on_batch(consumed, written)
+
+    for number, row in enumerate(rows, start=1):
+        if number <= skip:
+            continue
+        batch.append((number, row))
+        consumed = number
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    importer.finalize()
+    return consumed, written, rejected
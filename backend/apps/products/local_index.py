@@ -0,0 +1,83 @@
+"""
+Catalog indexes held in process memory (autocomplete, fuzzy search).
+
+A LocalIndex is built on first use, or in the background by warm_up() when
+the process starts serving requests. When the catalog version changes it is
+rebuilt in a background thread, at most every LOCAL_INDEX_REFRESH_SECONDS.
+Requests keep using the previous index while a rebuild runs.
+"""
+import threading
+import time
+import unicodedata
+from django.conf import settings
+from django.db import connection
+from .cache import get_catalog_version, replica_is_current
+
+INDEXES = []
+
+
+def normalize(text):
+    """Lowercase, strip accents and turn punctuation into single spaces"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char if char.isalnum() else ' ' for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+class LocalIndex:
+    def __init__(self, build, name):
+        self.build = build
+        self.name = name
+        self.current = None
+        self.version = None
+        self.built_at = 0
+        self.checked_at = 0
+        # Held while the index is being built
+        self.lock = threading.Lock()
+        INDEXES.append(self)
+
+    def rebuild(self):
+        with self.lock:
+            # Read the version first so changes made during the build trigger another one
+            version = get_catalog_version()
+            self.current = self.build()
+            # Built from a lagging replica: keep it, but refresh from `default` at the next check
+            self.version = version if replica_is_current(version) else None
+            self.built_at = time.monotonic()
+
+    def _rebuild_in_thread(self):
+        try:
+            self.rebuild()
+        finally:
+            connection.close()
+
+    def refresh_in_background(self):
+        if not self.lock.locked():
+            threading.Thread(target=self._rebuild_in_thread, name=self.name, daemon=True).start()
+
+    def get(self):
+        """The current index, built on first use and refreshed when the catalog changes"""
+        if self.current is None:
+            # Waits for a warm-up build that is already running
+            with self.lock:
+                pass
+            if self.current is None:
+                self.rebuild()
+            return self.current
+        interval = getattr(settings, 'LOCAL_INDEX_REFRESH_SECONDS', 30)
+        now = time.monotonic()
+        # The version is a database read, so it is checked at most once per interval
+        if now - max(self.built_at, self.checked_at) >= interval:
+            self.checked_at = now
+            if self.version != get_catalog_version():
+                self.refresh_in_background()
+        return self.current
+
+
+def warm_up(**kwargs):
+    """request_started receiver: build the indexes once the process starts serving"""
+    from django.core.signals import request_started
+    from . import autocomplete, trigrams  # noqa: F401  (register their indexes)
+    request_started.disconnect(warm_up, dispatch_uid='local_index_warm_up')
+    for index in INDEXES:
+        if index.current is None:
+            index.refresh_in_background()
@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.products.attributes import attribute_facets, filter_by_attributes
+from apps.products.models import Brand, Category, Product, ProductAttribute
+
+ATTRIBUTES = {
+    'Color': ['Red', 'Blue', 'Green', 'Black', 'White', 'Grey', 'Yellow', 'Pink', 'Orange', 'Purple'],
+    'Size': ['XS', 'S', 'M', 'L', 'XL', 'XXL'],
+    'Material': ['Cotton', 'Wool', 'Linen', 'Polyester', 'Silk', 'Leather', 'Denim', 'Nylon'],
+    'Fit': ['Slim', 'Regular', 'Relaxed', 'Oversized'],
+    'Pattern': ['Solid', 'Striped', 'Checked', 'Printed', 'Floral'],
+    'Season': ['Summer', 'Winter', 'All season'],
+}
+QUERIES = [
+    {'color': ['red'], 'size': ['m'], 'material': ['cotton']},
+    {'color': ['black', 'white'], 'size': ['l', 'xl'], 'fit': ['slim']},
+    {'pattern': ['striped'], 'season': ['winter'], 'material': ['wool', 'linen']},
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark 3-attribute intersections and attribute facets on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Everything runs inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.populate(options['products'])
+            base = Product.objects.filter(is_active=True, slug__startswith='attr-benchmark-')
+            for filters in QUERIES:
+                label = '&'.join(f'attr[{name}]={",".join(values)}' for name, values in filters.items())
+                unindexed = self.measure(lambda: self.unindexed_filter(base, filters), options['repeat'])
+                indexed = self.measure(lambda: self.indexed_filter(base, filters), options['repeat'])
+                facets = self.measure(lambda: (None, attribute_facets(base, filters)), options['repeat'])
+                self.stdout.write(
+                    f'{label}\n'
+                    f'    raw name/value join: {unindexed[0]:8.2f} ms ({unindexed[1]} hits)   '
+                    f'keyed index: {indexed[0]:8.2f} ms ({indexed[1]} hits)   '
+                    f'speedup: {unindexed[0] / max(indexed[0], 0.001):.1f}x   facets: {facets[0]:8.2f} ms'
+                )
+            transaction.set_rollback(True)
+
+    def populate(self, count):
+        rng = random.Random(42)
+        category = Category.objects.create(name='Attribute benchmark category')
+        brand = Brand.objects.create(name='Attribute benchmark brand')
+        started = time.perf_counter()
+        for offset in range(0, count, 5000):
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f'Attribute benchmark product {i}', slug=f'attr-benchmark-{i}', description='',
+                    price=rng.randint(100, 10000), category=category, brand=brand,
+                )
+                for i in range(offset, min(offset + 5000, count))
+            ])
+            attributes = []
+            for product in products:
+                for name, values in ATTRIBUTES.items():
+                    attribute = ProductAttribute(product=product, name=name, value=rng.choice(values))
+                    attribute.set_keys()
+                    attributes.append(attribute)
+            ProductAttribute.objects.bulk_create(attributes)
+        self.stdout.write(
+            f'Loaded {count} products with {count * len(ATTRIBUTES)} attributes in {time.perf_counter() - started:.1f}s'
+        )
+
+    def unindexed_filter(self, base, filters):
+        # Case-insensitive match on the raw columns, which no index can serve
+        queryset = base
+        for name, values in filters.items():
+            matching = ProductAttribute.objects.filter(name__iexact=name, value__iregex=r'^(' + '|'.join(values) + ')$')
+            queryset = queryset.filter(id__in=matching.values('product_id'))
+        return queryset.count(), list(queryset.order_by('-created_at')[:20])
+
+    def indexed_filter(self, base, filters):
+        queryset = filter_by_attributes(base, filters)
+        return queryset.count(), list(queryset.order_by('-created_at')[:20])
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits, _ = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), hits
@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from apps.products.cards import card_queryset, product_card
+from apps.products.models import Brand, Category, Product, ProductImage
+from apps.products.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductListSerializer with the card projection for list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Everything runs inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.populate(options['products'])
+            base = Product.objects.filter(is_active=True, name__startswith='Card benchmark').order_by('-created_at')
+            page_size = options['page_size']
+
+            def full_page():
+                page = base.select_related('category', 'brand').prefetch_related('images')[:page_size]
+                return ProductListSerializer(page, many=True).data
+
+            def card_page():
+                return [product_card(row) for row in card_queryset(base)[:page_size]]
+
+            for label, func in (('ProductListSerializer', full_page), ('card projection', card_page)):
+                ms, queries = self.measure(func, options['repeat'])
+                self.stdout.write(f'{label:22} {ms:8.2f} ms/page  {queries:3d} queries/page')
+            transaction.set_rollback(True)
+
+    def populate(self, count):
+        rng = random.Random(7)
+        root = Category.objects.create(name='Card benchmark root')
+        leaf = Category.objects.create(name='Card benchmark leaf', parent=root)
+        brand = Brand.objects.create(name='Card benchmark brand')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Card benchmark product {i}', slug=f'card-benchmark-{i}', description='x' * 500,
+                price=rng.randint(100, 10000), discount_price=rng.choice([None, 50]),
+                category=leaf, brand=brand, stock_quantity=rng.randint(0, 5),
+                rating_sum=rng.randint(0, 500), review_count=100,
+            )
+            for i in range(count)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'products/card-{product.pk}-{n}.jpg', is_primary=n == 0)
+            for product in products
+            for n in range(3)
+        ])
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), len(queries)
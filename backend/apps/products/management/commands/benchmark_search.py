@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from apps.products.models import Brand, Category, Product
+from apps.products.search import SEARCH_FIELDS, get_search_backend, search_products, tokenize
+
+WORDS = (
+    'wireless bluetooth headphones noise cancelling over ear stereo bass phone case leather wallet '
+    'charger fast usb cable laptop stand aluminium gaming mouse keyboard mechanical backlit smart '
+    'watch fitness tracker running shoes cotton shirt denim jacket winter summer kitchen knife steel '
+    'coffee maker espresso blender glass bottle water camera lens tripod portable speaker waterproof'
+).split()
+FILLER = [f'filler{i}' for i in range(5000)]
+
+
+class Command(BaseCommand):
+    help = 'Compare the full-text search index with the icontains (LIKE) search on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--queries', nargs='+', default=['headphones', 'wireless speaker', 'leather wallet', 'espresso'])
+
+    def handle(self, *args, **options):
+        # Everything runs inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.populate(options['products'])
+            for query in options['queries']:
+                like = self.measure(lambda: self.like_search(query), options['repeat'])
+                fts = self.measure(lambda: self.fulltext_search(query), options['repeat'])
+                self.stdout.write(
+                    f'{query!r:24} like: {like[0]:8.2f} ms ({like[1]} hits)   '
+                    f'fulltext: {fts[0]:8.2f} ms ({fts[1]} hits)   speedup: {like[0] / max(fts[0], 0.001):.1f}x'
+                )
+            transaction.set_rollback(True)
+
+    def populate(self, count):
+        rng = random.Random(42)
+        category = Category.objects.create(name='Benchmark category')
+        brand = Brand.objects.create(name='Benchmark brand')
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rng.sample(WORDS, 3)),
+                slug=f'benchmark-{i}',
+                short_description=' '.join(rng.sample(WORDS, 4)),
+                description=' '.join(rng.choices(FILLER, k=120) + rng.sample(WORDS, 2)),
+                price=rng.randint(100, 100000) / 100,
+                category=category,
+                brand=brand,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        get_search_backend().rebuild()
+        self.stdout.write(f'Loaded {count} products in {time.perf_counter() - started:.1f}s')
+
+    def like_search(self, query):
+        queryset = Product.objects.filter(is_active=True)
+        for term in tokenize(query):
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset.count(), list(queryset.order_by('-created_at')[:20])
+
+    def fulltext_search(self, query):
+        queryset = search_products(Product.objects.filter(is_active=True), query)
+        return queryset.count(), list(queryset.order_by('-search_rank')[:20])
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits, _ = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), hits
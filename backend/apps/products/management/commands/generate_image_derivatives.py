@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.products import images
+
+
+def process(job):
+    try:
+        return images.process_image_field(*job)
+    finally:
+        # Each executor thread has its own connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Generate missing (or, with --force, all) thumbnails and WebP renditions for catalog images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for (app_label, model_name), field_names in images.IMAGE_FIELDS.items():
+            model = apps.get_model(app_label, model_name)
+            for field_name in field_names:
+                rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                for obj in rows.only('pk', field_name, f'{field_name}_info').iterator():
+                    if options['force'] or images.needs_processing(obj, field_name):
+                        jobs.append((model._meta.label, obj.pk, field_name))
+
+        self.stdout.write(f'Processing {len(jobs)} images')
+        executor = images.get_executor()
+        futures = [executor.submit(process, job) for job in jobs]
+        failed = 0
+        for job, future in zip(jobs, futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{job[0]} #{job[1]} {job[2]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {len(jobs) - failed} images ({failed} failed)'))
@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.products.importers import IMPORTERS, Checkpoint, read_rows, run_import
+
+
+class Command(BaseCommand):
+    help = 'Stream brands, categories, products, images or attributes from a CSV/JSONL file into the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--update', action='store_true', help='Update rows whose slug already exists instead of creating new ones')
+        parser.add_argument('--resume', action='store_true', help='Skip the rows committed by a previous, interrupted run')
+
+    def handle(self, *args, **options):
+        entity, path = options['entity'], options['path']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        try:
+            rows = read_rows(path, options['format'])
+            checkpoint = Checkpoint(path, entity)
+            skip = checkpoint.load() if options['resume'] else 0
+            if skip:
+                self.stdout.write(f'Resuming after row {skip}')
+
+            started = time.perf_counter()
+
+            def on_batch(consumed, written):
+                checkpoint.save(consumed)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{consumed} rows read, {written} written ({written / elapsed:.0f} rows/s)')
+
+            def on_error(number, error):
+                self.stderr.write(f'row {number}: {error}')
+
+            importer = IMPORTERS[entity](update=options['update'])
+            consumed, written, rejected = run_import(
+                importer, rows, options['batch_size'], skip=skip, on_batch=on_batch, on_error=on_error
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        checkpoint.clear()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {written} {entity} in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} rows/s), {rejected} rejected'
+        ))
+        if entity == 'images':
+            self.stdout.write('Run generate_image_derivatives to build renditions for the new images')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from apps.products import object_cache
+
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the product and category detail object cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = object_cache.get_stats()
+        total = sum(stats.values())
+        for status, count in stats.items():
+            self.stdout.write(f'{status:<10} {count}')
+        hits = stats['HIT-LOCAL'] + stats['HIT']
+        ratio = f'{hits / total:.1%}' if total else 'n/a'
+        if options['reset']:
+            object_cache.reset_stats()
+        self.stdout.write(self.style.SUCCESS(f'Hit ratio {ratio} over {total} requests'))
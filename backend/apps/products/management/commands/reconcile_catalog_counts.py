@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from apps.products import object_cache
+from apps.products.cache import bump_catalog_version_on_commit
+from apps.products.models import Brand, Category, CategoryClosure
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in the stored brand and category product counters (safe to run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            brand_counts = dict(
+                Brand.objects.annotate(
+                    actual=Count('products', filter=Q(products__is_active=True))
+                ).values_list('id', 'actual')
+            )
+            brands = self.repair(Brand, brand_counts)
+            categories = self.repair(Category, CategoryClosure.product_counts())
+            if brands or categories:
+                object_cache.invalidate_all()
+                bump_catalog_version_on_commit()
+
+        self.stdout.write(self.style.SUCCESS(f'Repaired {brands} brand and {categories} category counters'))
+
+    def repair(self, model, counts):
+        stale = []
+        for obj in model.objects.only('id', 'products_count'):
+            actual = counts.get(obj.id, 0)
+            if obj.products_count != actual:
+                obj.products_count = actual
+                stale.append(obj)
+        model.objects.bulk_update(stale, ['products_count'], batch_size=1000)
+        return len(stale)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from apps.products.popularity import HALF_LIFE_DAYS, REVIEW_WEIGHT, WINDOW_DAYS, refresh_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute the product popularity score behind ordering=popularity (run periodically, e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life-days', type=float, default=HALF_LIFE_DAYS)
+        parser.add_argument('--window-days', type=int, default=WINDOW_DAYS)
+        parser.add_argument('--review-weight', type=float, default=REVIEW_WEIGHT)
+
+    def handle(self, *args, **options):
+        updated = refresh_popularity(options['half_life_days'], options['window_days'], options['review_weight'])
+        self.stdout.write(self.style.SUCCESS(f'Updated the popularity of {updated} products'))
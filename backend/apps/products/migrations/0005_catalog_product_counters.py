@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:27
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    Brand = apps.get_model('products', 'Brand')
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    brands = Brand.objects.annotate(actual=Count('products', filter=Q(products__is_active=True)))
+    Brand.objects.bulk_update([Brand(id=b.id, products_count=b.actual) for b in brands], ['products_count'])
+    counts = Product.objects.filter(is_active=True).values_list('category__ancestor_links__ancestor').annotate(count=Count('id'))
+    Category.objects.bulk_update([Category(id=pk, products_count=n) for pk, n in counts], ['products_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
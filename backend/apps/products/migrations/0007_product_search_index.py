@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:30
+
+import apps.products.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The SQL of apps.products.search as of this migration, kept here so later changes there cannot alter it
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(products_product.name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(products_product.short_description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(products_product.description, '')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5('
+            "name, short_description, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO products_product_fts (rowid, name, short_description, description) '
+            'SELECT id, name, short_description, description FROM products_product'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS product_search_vector_idx ON products_product USING GIN (({POSTGRES_VECTOR}))'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS products_product_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='products.product')),
+                ('document', apps.products.fields.FullTextDocumentField(db_column='products_product_fts')),
+                ('name', models.TextField()),
+                ('short_description', models.TextField()),
+                ('description', models.TextField()),
+            ],
+            options={
+                'db_table': 'products_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:43
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def backfill_keys(apps, schema_editor):
+    ProductAttribute = apps.get_model('products', 'ProductAttribute')
+    batch = []
+    for attribute in ProductAttribute.objects.only('id', 'name', 'value').iterator(chunk_size=2000):
+        attribute.name_key = slugify(attribute.name)
+        attribute.value_key = ' '.join(attribute.value.split()).lower()
+        batch.append(attribute)
+        if len(batch) == 2000:
+            ProductAttribute.objects.bulk_update(batch, ['name_key', 'value_key'])
+            batch = []
+    ProductAttribute.objects.bulk_update(batch, ['name_key', 'value_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_image_derivative_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productattribute',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='productattribute',
+            name='value_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['name_key', 'value_key', 'product'], name='product_attr_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['product', 'name_key', 'value_key'], name='product_attr_facet_idx'),
+        ),
+    ]
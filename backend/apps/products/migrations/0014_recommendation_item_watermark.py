@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def convert_watermarks(apps, schema_editor):
+    # An order id watermark covered every item of the orders up to it
+    RecommendationRun = apps.get_model('products', 'RecommendationRun')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    for run in RecommendationRun.objects.filter(last_item_id__gt=0):
+        last = OrderItem.objects.filter(order_id__lte=run.last_item_id).aggregate(last=Max('id'))['last']
+        RecommendationRun.objects.filter(pk=run.pk).update(last_item_id=last or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('products', '0013_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='recommendationrun',
+            old_name='last_order_id',
+            new_name='last_item_id',
+        ),
+        migrations.RunPython(convert_watermarks, migrations.RunPython.noop),
+    ]
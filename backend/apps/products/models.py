@@ -1,17 +1,40 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from apps.authentication.models import User
+from .fields import FullTextDocumentField
+
+
+def exclude_derived_fields(instance, kwargs):
+    """
+    Keep a plain save() of an existing row from overwriting derived fields
+    (counters maintained with F() updates, image info written by the image
+    pipeline) that may be stale on the in-memory instance.
+    """
+    if instance._state.adding or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.DERIVED_FIELDS
+    ]
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
+    image_info = models.JSONField(default=dict, blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     is_active = models.BooleanField(default=True)
     sort_order = models.IntegerField(default=0)
+    # Active products in this category and all subcategories, maintained by Product.save()
+    products_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    DERIVED_FIELDS = ['products_count', 'image_info']
+
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['sort_order', 'name']
@@ -20,40 +43,152 @@ class Category(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
+        if not self.slug or self.slug.strip() == '':
             from django.utils.text import slugify
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+
+        adding = self._state.adding
+        old_parent_id = None
+        if not adding:
+            old_parent_id = Category.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+
+        exclude_derived_fields(self, kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                CategoryClosure.insert_node(self)
+            elif old_parent_id != self.parent_id:
+                CategoryClosure.move_subtree(self)
 
     @property
     def get_absolute_url(self):
         return f"/category/{self.slug}/"
 
+    def get_descendants(self, include_self=False):
+        """Get all descendant categories with a single closure-table query"""
+        min_depth = 0 if include_self else 1
+        return Category.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gte=min_depth)
+
     def get_all_children(self):
         """Get all child categories recursively"""
-        children = list(self.children.all())
-        for child in list(children):
-            children.extend(child.get_all_children())
-        return children
+        return list(self.get_descendants())
+
+    def get_products(self):
+        """Get products in this category and all of its subcategories"""
+        return Product.objects.filter(category__ancestor_links__ancestor=self)
 
     def get_products_count(self):
         """Get total product count including subcategories"""
-        all_categories = [self.id] + [cat.id for cat in self.get_all_children()]
-        return Product.objects.filter(category_id__in=all_categories, is_active=True).count()
-    
-    def save(self, *args, **kwargs):
-        if not self.slug or self.slug.strip() == '':
-            from django.utils.text import slugify
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        return self.get_products().filter(is_active=True).count()
+
+
+class CategoryClosure(models.Model):
+    """
+    Closure table for the category tree: one row per (ancestor, descendant)
+    pair, including a depth-0 row linking every category to itself.
+
+    Rows are maintained by Category.save(); deleting a category removes its
+    rows through the foreign key cascade.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    @classmethod
+    def insert_node(cls, category):
+        """Link a newly created category to itself and to all ancestors of its parent"""
+        links = [cls(ancestor_id=category.pk, descendant_id=category.pk, depth=0)]
+        if category.parent_id:
+            for ancestor_id, depth in cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth'):
+                links.append(cls(ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth + 1))
+        cls.objects.bulk_create(links)
+
+    @classmethod
+    def move_subtree(cls, category):
+        """Re-attach the subtree rooted at category under its current parent"""
+        subtree = list(cls.objects.filter(ancestor_id=category.pk).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        if category.parent_id in subtree_ids:
+            raise ValueError("A category cannot be moved under itself or one of its descendants.")
+
+        products_count = Category.objects.filter(pk=category.pk).values_list('products_count', flat=True).first() or 0
+
+        # Drop every link from outside the subtree into it
+        old_links = cls.objects.filter(descendant_id=category.pk).exclude(ancestor_id__in=subtree_ids)
+        Category.objects.filter(pk__in=list(old_links.values_list('ancestor_id', flat=True))).update(
+            products_count=Greatest(models.F('products_count') - products_count, 0),
+            updated_at=timezone.now()
+        )
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+        if category.parent_id:
+            ancestors = list(cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth'))
+            cls.objects.bulk_create([
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, depth in subtree
+            ])
+            Category.objects.filter(pk__in=[ancestor_id for ancestor_id, _ in ancestors]).update(
+                products_count=models.F('products_count') + products_count,
+                updated_at=timezone.now()
+            )
+
+    @classmethod
+    def recount(cls, category_ids):
+        """Recompute the stored active product counters of the given categories"""
+        rows = Product.objects.filter(
+            is_active=True, category__ancestor_links__ancestor_id__in=category_ids
+        ).values_list('category__ancestor_links__ancestor').annotate(count=models.Count('id'))
+        counts = dict(rows)
+        now = timezone.now()
+        for category_id in set(category_ids):
+            Category.objects.filter(pk=category_id).update(products_count=counts.get(category_id, 0), updated_at=now)
+
+    @classmethod
+    def product_counts(cls):
+        """Map category id -> active products in that category and its subcategories, in one query"""
+        rows = Product.objects.filter(is_active=True).values_list('category__ancestor_links__ancestor').annotate(count=models.Count('id'))
+        return dict(rows)
+
+    @classmethod
+    def rebuild(cls):
+        """Rebuild the whole closure table from Category.parent. Returns the number of rows written."""
+        parents = dict(Category.objects.values_list('id', 'parent_id'))
+        links = []
+        for category_id in parents:
+            node, depth, seen = category_id, 0, set()
+            while node is not None and node not in seen:
+                seen.add(node)
+                links.append(cls(ancestor_id=node, descendant_id=category_id, depth=depth))
+                node, depth = parents.get(node), depth + 1
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(links, batch_size=1000)
+        return len(links)
 
 
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True)
     logo = models.ImageField(upload_to='brands/', null=True, blank=True)
+    logo_info = models.JSONField(default=dict, blank=True)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Active products of this brand, maintained by Product.save()
+    products_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    DERIVED_FIELDS = ['products_count', 'logo_info']
 
     def __str__(self):
         return self.name
@@ -62,6 +197,7 @@ class Brand(models.Model):
         if not self.slug:
             from django.utils.text import slugify
             self.slug = slugify(self.name)
+        exclude_derived_fields(self, kwargs)
         super().save(*args, **kwargs)
 
 class Product(models.Model):
@@ -76,9 +212,34 @@ class Product(models.Model):
     stock_quantity = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
+    # Review aggregates, maintained by apps.reviews signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Time-decayed units sold plus review weight, refreshed by refresh_popularity
+    popularity = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    DERIVED_FIELDS = [
+        'rating_sum', 'review_count',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        'popularity',
+    ]
+
+    class Meta:
+        # Keyset pagination: one index per sortable column with id as tie-breaker
+        indexes = [
+            models.Index(fields=['is_active', 'price', 'id'], name='product_active_price_idx'),
+            models.Index(fields=['is_active', 'created_at', 'id'], name='product_active_created_idx'),
+            models.Index(fields=['is_active', 'name', 'id'], name='product_active_name_idx'),
+            models.Index(fields=['is_active', 'popularity', 'id'], name='product_active_popularity_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -86,15 +247,65 @@ class Product(models.Model):
         if not self.slug:
             from django.utils.text import slugify
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+
+        previous = None
+        if not self._state.adding:
+            previous = Product.objects.filter(pk=self.pk).values_list('is_active', 'category_id', 'brand_id').first()
+        current = (self.is_active, self.category_id, self.brand_id)
+
+        exclude_derived_fields(self, kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous != current:
+                if previous and previous[0]:
+                    Product.adjust_counters(previous[1], previous[2], -1)
+                if self.is_active:
+                    Product.adjust_counters(self.category_id, self.brand_id, 1)
+
+            from .search import get_search_backend
+            get_search_backend().index_products([self])
+
+    @staticmethod
+    def adjust_counters(category_id, brand_id, delta):
+        """Add delta to the active product counters of a brand and a category with its ancestors"""
+        # Clamp at zero so drift from bulk operations cannot break a delete
+        counter = Greatest(models.F('products_count') + delta, 0)
+        now = timezone.now()
+        Brand.objects.filter(pk=brand_id).update(products_count=counter, updated_at=now)
+        Category.objects.filter(descendant_links__descendant_id=category_id).update(products_count=counter, updated_at=now)
 
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
+        if self.review_count:
+            return self.rating_sum / self.review_count
         return 0
 
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    @classmethod
+    def apply_rating_change(cls, product_id, old_rating=None, new_rating=None):
+        """Adjust the stored review aggregates in a single UPDATE"""
+        updates = {}
+        if old_rating is not None:
+            updates['rating_sum'] = models.F('rating_sum') - old_rating
+            updates['review_count'] = models.F('review_count') - 1
+            updates[f'rating_{old_rating}_count'] = models.F(f'rating_{old_rating}_count') - 1
+        if new_rating is not None:
+            updates['rating_sum'] = updates.get('rating_sum', models.F('rating_sum')) + new_rating
+            updates['review_count'] = updates.get('review_count', models.F('review_count')) + 1
+            key = f'rating_{new_rating}_count'
+            updates[key] = updates.get(key, models.F(key)) + 1
+        if updates:
+            updates = {field: Greatest(expression, 0) for field, expression in updates.items()}
+            cls.objects.filter(pk=product_id).update(updated_at=timezone.now(), **updates)
+
+    @classmethod
+    def touch(cls, product_id):
+        """Mark a product as modified when one of its images or attributes changes"""
+        cls.objects.filter(pk=product_id).update(updated_at=timezone.now())
+
     @property
     def current_price(self):
         return self.discount_price if self.discount_price else self.price
@@ -109,10 +320,112 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Size, dominant color and WebP renditions, written by apps.products.images
+    image_info = models.JSONField(default=dict, blank=True)
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
 
+    DERIVED_FIELDS = ['image_info']
+
+    def save(self, *args, **kwargs):
+        exclude_derived_fields(self, kwargs)
+        super().save(*args, **kwargs)
+
 class ProductAttribute(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='attributes')
     name = models.CharField(max_length=100)
     value = models.CharField(max_length=255)
+    # Normalized copies of name/value matched by attr[<name_key>]=<value_key> filters
+    name_key = models.CharField(max_length=100, default='', editable=False)
+    value_key = models.CharField(max_length=255, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # Filtering: products having a given name/value pair (covering)
+            models.Index(fields=['name_key', 'value_key', 'product'], name='product_attr_lookup_idx'),
+            # Facets: name/value pairs of a set of products (covering)
+            models.Index(fields=['product', 'name_key', 'value_key'], name='product_attr_facet_idx'),
+        ]
+
+    @staticmethod
+    def normalize_name(name):
+        from django.utils.text import slugify
+        return slugify(name)
+
+    @staticmethod
+    def normalize_value(value):
+        return ' '.join(str(value).split()).lower()
+
+    def set_keys(self):
+        self.name_key = self.normalize_name(self.name)
+        self.value_key = self.normalize_value(self.value)
+
+    def save(self, *args, **kwargs):
+        self.set_keys()
+        super().save(*args, **kwargs)
+
+
+class ProductSearchIndex(models.Model):
+    """
+    SQLite FTS5 virtual table holding the searchable text of each product,
+    keyed by product id. Created by migration on SQLite only; see search.py.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_index'
+    )
+    document = FullTextDocumentField(db_column='products_product_fts')
+    name = models.TextField()
+    short_description = models.TextField()
+    description = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
+
+
+class ProductPairCount(models.Model):
+    """
+    Sparse product co-occurrence matrix: the number of orders containing both
+    products. Stored in both directions; maintained by recommendations.py.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['product', 'other']
+
+
+class RelatedProduct(models.Model):
+    """Top-K frequently-bought-together neighbours of a product, ranked from 1"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    rank = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='related_product_rank_idx'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """One co-occurrence build; last_item_id (an OrderItem id) is the watermark for the next incremental run"""
+    last_item_id = models.PositiveBigIntegerField(default=0)
+    full = models.BooleanField(default=False)
+    orders = models.PositiveIntegerField(default=0)
+    products = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        get_latest_by = 'id'
+
+
+class CatalogVersion(models.Model):
+    """
+    Single-row catalog version, bumped after every committed catalog write.
+    It lives in the database so every process keys its caches by the same value.
+    """
+    version = models.PositiveBigIntegerField()
@@ -0,0 +1,201 @@
+"""
+Read-through cache of serialized catalog objects, keyed by slug.
+
+ProductDetailView and CategoryDetailView serve their default payload (no
+fields=/omit=/expand=) from here. A product entry holds the product with its
+category and brand reduced to slugs; the nested category and brand are their
+own entries and are composed in on read. Every product save changes the
+counters of its brand and category, so caching them inside each product
+would invalidate a whole brand's products on every write.
+
+Every object has a version key in the catalog cache. Signals (see signals.py)
+delete the version keys of exactly the objects a write affects once it
+commits, and entries stored under another version are ignored. A bounded
+process-local LRU of OBJECT_CACHE_LOCAL_SIZE entries sits in front of the
+shared cache and is validated against the same version keys, so it never
+serves an entry that another process invalidated. invalidate_all() drops
+everything after bulk jobs that bypass signals.
+
+Entries built on a read replica that is behind the catalog version are not
+stored, since the invalidation they would follow may not have replicated.
+
+When the catalog cache is process-local (LocMemCache, the default), deleted
+version keys are only seen by the writing process, so entries are also
+stamped with the catalog version, which every process reads from the
+database. Any catalog write then invalidates every entry.
+
+Hits and misses are counted in the shared cache; see `manage.py object_cache_stats`.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework import serializers
+from .cache import get_catalog_cache, get_catalog_version, replica_is_current
+from .models import Brand, Category, Product
+from .serializers import BrandSerializer, CategorySerializer, ProductDetailSerializer
+
+GENERATION_KEY = 'catalog:object:generation'
+STATUSES = ['HIT-LOCAL', 'HIT', 'MISS']
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class CachedProductSerializer(ProductDetailSerializer):
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    brand = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+
+def version_key(kind, slug):
+    return f'catalog:object:version:{kind}:{slug}'
+
+
+def entry_key(kind, slug, origin):
+    return f'catalog:object:{kind}:{origin}:{slug}'
+
+
+def stats_key(status):
+    return f'catalog:object:stats:{status}'
+
+
+def record(status):
+    cache = get_catalog_cache()
+    try:
+        cache.incr(stats_key(status))
+    except ValueError:
+        cache.add(stats_key(status), 1, None)
+
+
+def get_stats():
+    values = get_catalog_cache().get_many([stats_key(status) for status in STATUSES])
+    return {status: values.get(stats_key(status), 0) for status in STATUSES}
+
+
+def reset_stats():
+    get_catalog_cache().delete_many([stats_key(status) for status in STATUSES])
+
+
+def _local_get(key):
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is not None:
+            _local.move_to_end(key)
+        return entry
+
+
+def _local_set(key, entry):
+    with _local_lock:
+        _local[key] = entry
+        _local.move_to_end(key)
+        while len(_local) > getattr(settings, 'OBJECT_CACHE_LOCAL_SIZE', 1000):
+            _local.popitem(last=False)
+
+
+def get_stamp(cache, values, vkey):
+    """(generation, object version, catalog version for process-local caches) that an entry must match"""
+    catalog_version = get_catalog_version() if isinstance(cache, LocMemCache) else None
+    return (values.get(GENERATION_KEY), values.get(vkey), catalog_version)
+
+
+def get_or_build(kind, slug, request, build):
+    """
+    The cached value of (kind, slug) for the request's origin, or build() on a miss.
+    Returns (value, status) with status 'HIT-LOCAL', 'HIT' or 'MISS'.
+    A None result of build() is not cached.
+    """
+    cache = get_catalog_cache()
+    # Image URLs in the payload are absolute, so entries are per origin
+    origin = f'{request.scheme}://{request.get_host()}'
+    vkey, ekey = version_key(kind, slug), entry_key(kind, slug, origin)
+
+    local = _local_get(ekey)
+    values = cache.get_many([GENERATION_KEY, vkey] if local is not None else [GENERATION_KEY, vkey, ekey])
+    stamp = get_stamp(cache, values, vkey)
+    if stamp[1] is not None:
+        if local is not None and local[0] == stamp:
+            return local[1], 'HIT-LOCAL'
+        shared = values.get(ekey)
+        if shared is not None and shared[0] == stamp:
+            _local_set(ekey, shared)
+            return shared[1], 'HIT'
+
+    if stamp[0] is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+    if stamp[1] is None:
+        cache.add(vkey, uuid.uuid4().hex, None)
+    # Take the stamp before building, so an invalidation during the build wins
+    values = cache.get_many([GENERATION_KEY, vkey])
+    stamp = get_stamp(cache, values, vkey)
+    catalog_version = get_catalog_version()
+    value = build()
+    if value is not None and replica_is_current(catalog_version):
+        cache.set(ekey, (stamp, value))
+        _local_set(ekey, (stamp, value))
+    return value, 'MISS'
+
+
+def is_cacheable(request):
+    return not any(request.query_params.get(name) for name in ('fields', 'omit', 'expand'))
+
+
+def get_category(request, slug):
+    """({'is_active', 'data'}, status) for a category of any state, or (None, status)"""
+    def build():
+        category = Category.objects.select_related('parent').filter(slug=slug).first()
+        if category is None:
+            return None
+        return {'is_active': category.is_active, 'data': dict(CategorySerializer(category, context={'request': request}).data)}
+    return get_or_build('category', slug, request, build)
+
+
+def get_brand(request, slug):
+    def build():
+        brand = Brand.objects.filter(slug=slug).first()
+        return dict(BrandSerializer(brand, context={'request': request}).data) if brand else None
+    return get_or_build('brand', slug, request, build)
+
+
+def get_product(request, slug):
+    """(ProductDetailSerializer payload, status) for an active product, or (None, status)"""
+    def build():
+        queryset = Product.objects.filter(slug=slug, is_active=True).select_related('category', 'brand')
+        product = queryset.prefetch_related('images', 'attributes').first()
+        return dict(CachedProductSerializer(product, context={'request': request}).data) if product else None
+
+    entry, status = get_or_build('product', slug, request, build)
+    if entry is None:
+        return None, status
+    data = dict(entry)
+    category, _ = get_category(request, entry['category'])
+    data['category'] = category['data'] if category else None
+    data['brand'], _ = get_brand(request, entry['brand'])
+    return data, status
+
+
+def invalidate(kind, slugs):
+    """Drop the cached entries of the given objects once the current transaction commits"""
+    keys = [version_key(kind, slug) for slug in set(slugs) if slug]
+    if keys:
+        transaction.on_commit(lambda: get_catalog_cache().delete_many(keys))
+
+
+def invalidate_products(**lookups):
+    invalidate('product', Product.objects.filter(**lookups).values_list('slug', flat=True))
+
+
+def invalidate_brands(ids):
+    invalidate('brand', Brand.objects.filter(pk__in=ids).values_list('slug', flat=True))
+
+
+def invalidate_categories(ids, ancestors=True):
+    """Invalidate categories, and by default their ancestors, whose counters include them"""
+    lookup = 'descendant_links__descendant_id__in' if ancestors else 'pk__in'
+    invalidate('category', Category.objects.filter(**{lookup: ids}).values_list('slug', flat=True))
+
+
+def invalidate_all():
+    """Drop every cached object, e.g. after a bulk job that bypassed the signals"""
+    transaction.on_commit(lambda: get_catalog_cache().set(GENERATION_KEY, uuid.uuid4().hex, None))
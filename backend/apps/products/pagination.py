@@ -0,0 +1,119 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Page-number pagination with an optional keyset (cursor) mode.
+
+    Keyset mode is used when the request carries `cursor` or `pagination=cursor`.
+    Rows are ordered by one of `ordering_fields` with `id` as a unique tie-breaker,
+    and each page is fetched with a `WHERE (field, id) > (last_field, last_id)`
+    style filter instead of OFFSET, so every page costs the same. The total count
+    is skipped unless `include_count=true` is passed. Searches ordered by
+    relevance have no stable key to page by and always use page numbers.
+    """
+    page_size = 20
+    cursor_query_param = 'cursor'
+    ordering_fields = ['price', 'created_at', 'name', 'popularity']
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def use_cursor(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get('pagination') == 'cursor'
+        )
+
+    def is_relevance_ordered(self, queryset):
+        return any(str(term).lstrip('-') == 'search_rank' for term in queryset.query.order_by)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request) and not self.is_relevance_ordered(queryset)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = self.get_ordering(request, view)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+
+        self.count = None
+        if request.query_params.get('include_count') == 'true':
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(self.ordering, '-id' if descending else 'id')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value = self.parse_value(queryset.model, field, cursor['v'])
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': cursor['id']})
+            )
+
+        page_size = self.get_page_size(request)
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page_rows = results[:page_size]
+        return self.page_rows
+
+    def get_ordering(self, request, view=None):
+        ordering_fields = getattr(view, 'ordering_fields', None) or self.ordering_fields
+        term = request.query_params.get('ordering', '').split(',')[0].strip()
+        if term.lstrip('-') in ordering_fields:
+            return term
+        return self.default_ordering
+
+    def parse_value(self, model, field, raw):
+        try:
+            return model._meta.get_field(field).to_python(raw)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        field = self.ordering.lstrip('-')
+        # Rows are model instances, or dicts when the view pages a values() queryset
+        if isinstance(obj, dict):
+            value, pk = obj[field], obj['id']
+        else:
+            value, pk = getattr(obj, field), obj.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        payload = {'o': self.ordering, 'v': str(value), 'id': pk}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if payload['o'] != self.ordering:
+                raise ValueError
+            return {'v': payload['v'], 'id': int(payload['id'])}
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page_rows[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        payload = {'next': self.get_next_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
@@ -0,0 +1,61 @@
+"""
+Materialized popularity score used by `ordering=popularity`.
+
+    popularity = sum(units sold on day d * 0.5 ** (age of d in days / HALF_LIFE_DAYS))
+               + REVIEW_WEIGHT * rating_sum / 5
+
+Sales come from one GROUP BY (product, day) over the non-cancelled order
+items of the last WINDOW_DAYS; older sales have decayed to almost nothing.
+Reviews use the stored rating_sum, so a product with ten 5-star reviews
+weighs as much as REVIEW_WEIGHT * 10 units sold today.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.orders.models import OrderItem
+from . import object_cache
+from .cache import bump_catalog_version
+from .models import Product
+
+HALF_LIFE_DAYS = 30
+WINDOW_DAYS = 180
+REVIEW_WEIGHT = 0.5
+BATCH_SIZE = 1000
+
+
+def decayed_sales(half_life_days=HALF_LIFE_DAYS, window_days=WINDOW_DAYS, now=None):
+    """{product_id: time-decayed units sold}"""
+    today = timezone.localdate(now)
+    rows = OrderItem.objects.filter(
+        order__created_at__gte=(now or timezone.now()) - timedelta(days=window_days)
+    ).exclude(order__status='cancelled').annotate(
+        day=TruncDate('order__created_at')
+    ).values_list('product_id', 'day').annotate(units=Sum('quantity')).order_by()
+
+    sales = defaultdict(float)
+    for product_id, day, units in rows:
+        sales[product_id] += units * 0.5 ** ((today - day).days / half_life_days)
+    return sales
+
+
+def refresh_popularity(half_life_days=HALF_LIFE_DAYS, window_days=WINDOW_DAYS, review_weight=REVIEW_WEIGHT):
+    """Recompute every product's popularity and write the changed ones in bulk. Returns the number updated."""
+    sales = decayed_sales(half_life_days, window_days)
+    changed = []
+    updated = 0
+    for pk, current, rating_sum in Product.objects.values_list('id', 'popularity', 'rating_sum').iterator(chunk_size=BATCH_SIZE):
+        score = round(sales.get(pk, 0) + review_weight * rating_sum / 5, 4)
+        if score != current:
+            changed.append(Product(id=pk, popularity=score))
+        if len(changed) == BATCH_SIZE:
+            Product.objects.bulk_update(changed, ['popularity'])
+            updated += len(changed)
+            changed = []
+    Product.objects.bulk_update(changed, ['popularity'])
+    updated += len(changed)
+    if updated:
+        bump_catalog_version()
+        object_cache.invalidate_all()
+    return updated
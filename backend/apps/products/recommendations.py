@@ -0,0 +1,118 @@
+"""
+Frequently-bought-together recommendations from order history.
+
+A build reads OrderItem (product ids only) ordered by order, in chunks, and
+counts the product pairs of each order into a sparse co-occurrence matrix
+held as a Counter. Every `flush_orders` orders the counts are added to the
+ProductPairCount table with one INSERT ... ON CONFLICT DO UPDATE statement
+per batch, so memory stays bounded. Afterwards the top-K neighbours of every
+product whose counts changed are re-ranked with a window query and stored
+in RelatedProduct, which the related endpoint reads with one indexed lookup.
+
+Incremental builds only count order items after the previous run's
+watermark (RecommendationRun.last_item_id). Orders are not created in one
+transaction, so a run can see part of a basket; when the rest arrives, only
+the pairs involving the new items are added. A full build starts from
+scratch, which also drops pairs from orders that have since been cancelled.
+"""
+from collections import Counter
+from itertools import combinations, groupby
+from django.db import connection, transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+from apps.orders.models import OrderItem
+from .cache import bump_catalog_version
+from .models import ProductPairCount, RecommendationRun, RelatedProduct
+
+DEFAULT_TOP_K = 10
+RERANK_BATCH = 500
+
+
+def order_baskets(after_id, up_to_id, chunk_size):
+    """
+    Yield (counted, added) product id sets of each non-cancelled order with
+    items in (after_id, up_to_id]: the products of its items up to after_id,
+    which earlier runs counted, and the other products of its new items
+    """
+    new_items = OrderItem.objects.filter(id__gt=after_id, id__lte=up_to_id).values('order_id')
+    items = OrderItem.objects.filter(
+        order_id__in=new_items, id__lte=up_to_id
+    ).exclude(order__status='cancelled').order_by('order_id').values_list('order_id', 'id', 'product_id')
+    for _, rows in groupby(items.iterator(chunk_size=chunk_size), key=lambda row: row[0]):
+        counted, added = set(), set()
+        for _, item_id, product_id in rows:
+            (counted if item_id <= after_id else added).add(product_id)
+        yield counted, added - counted
+
+
+def basket_pairs(counted, added):
+    """The (a, b) pairs, a < b, of counted | added that include an added product"""
+    basket = sorted(counted | added)
+    return [(a, b) for a, b in combinations(basket, 2) if a in added or b in added]
+
+
+def merge_pair_counts(pairs):
+    """Add {(a, b): n} counts (a < b) to ProductPairCount, in both directions"""
+    table = connection.ops.quote_name(ProductPairCount._meta.db_table)
+    sql = (
+        f'INSERT INTO {table} (product_id, other_id, count) VALUES (%s, %s, %s) '
+        f'ON CONFLICT (product_id, other_id) DO UPDATE SET count = {table}.count + excluded.count'
+    )
+    rows = [(a, b, n) for (a, b), n in pairs.items()] + [(b, a, n) for (a, b), n in pairs.items()]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def rerank(product_ids, top_k):
+    """Rebuild the RelatedProduct rows of the given products from their pair counts"""
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), RERANK_BATCH):
+        batch = product_ids[start:start + RERANK_BATCH]
+        ranked = ProductPairCount.objects.filter(product_id__in=batch).annotate(
+            rank=Window(RowNumber(), partition_by=[F('product_id')], order_by=[F('count').desc(), F('other_id').asc()])
+        ).filter(rank__lte=top_k).values_list('product_id', 'other_id', 'rank', 'count')
+        RelatedProduct.objects.filter(product_id__in=batch).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=product_id, related_id=other_id, rank=rank, count=count)
+            for product_id, other_id, rank, count in ranked
+        ])
+
+
+def build_recommendations(full=False, top_k=DEFAULT_TOP_K, chunk_size=5000, flush_orders=20000, progress=None):
+    """
+    Count co-occurrences of the order items since the last run (or all items
+    when full=True) and refresh the affected top-K lists. Runs in one transaction so
+    the counts and the watermark always move together. Returns the RecommendationRun.
+    """
+    previous = RecommendationRun.objects.order_by('-id').first()
+    with transaction.atomic():
+        if full or previous is None:
+            full, after_id = True, 0
+            ProductPairCount.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+        else:
+            after_id = previous.last_item_id
+        up_to_id = OrderItem.objects.aggregate(last=Max('id'))['last'] or after_id
+
+        pairs, touched, orders = Counter(), set(), 0
+        for counted, added in order_baskets(after_id, up_to_id, chunk_size):
+            orders += 1
+            new_pairs = basket_pairs(counted, added)
+            if not new_pairs:
+                continue
+            pairs.update(new_pairs)
+            touched.update(counted | added)
+            if orders % flush_orders == 0:
+                merge_pair_counts(pairs)
+                pairs.clear()
+                if progress:
+                    progress(orders)
+        merge_pair_counts(pairs)
+
+        rerank(touched, top_k)
+        run = RecommendationRun.objects.create(
+            last_item_id=max(up_to_id, after_id), full=full, orders=orders, products=len(touched)
+        )
+    if touched:
+        bump_catalog_version()
+    return run
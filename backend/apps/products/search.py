@@ -0,0 +1,195 @@
+"""
+Full-text product search.
+
+SQLite uses an FTS5 virtual table (ProductSearchIndex) that is written on
+Product.save() and ranked with bm25. PostgreSQL uses a weighted tsvector
+expression with a GIN index over the same expression, which the database keeps
+current on its own. Any other database falls back to icontains matching.
+"""
+import re
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from .models import Product
+from .trigrams import fuzzy_search
+
+SEARCH_FIELDS = ['name', 'short_description', 'description']
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def no_matches(queryset):
+    """An empty result that still has search_rank, so ordering by relevance remains valid"""
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+class SQLiteSearchBackend:
+    table = 'products_product_fts'
+    # bm25 column weights, in SEARCH_FIELDS order
+    weights = (10.0, 4.0, 1.0)
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"{', '.join(SEARCH_FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def build_match(self, query):
+        # Quote every token so user input cannot inject FTS5 syntax; prefix-match each one
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return no_matches(queryset)
+        rank = Func(
+            F('search_index__document'), *[Value(weight) for weight in self.weights],
+            function='bm25', template='-%(function)s(%(expressions)s)', output_field=FloatField()
+        )
+        return queryset.filter(search_index__document__match=match).annotate(search_rank=rank)
+
+    def index_products(self, products):
+        rows = [(product.pk, *[getattr(product, field) for field in SEARCH_FIELDS]) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(SEARCH_FIELDS)}) VALUES (%s, %s, %s, %s)", rows
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        columns = ', '.join(SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, {columns}) '
+                f'SELECT id, {columns} FROM {Product._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend:
+    index_name = 'product_search_vector_idx'
+    vector = ' || '.join(
+        f"setweight(to_tsvector('english', coalesce(products_product.{field}, '')), '{weight}')"
+        for field, weight in zip(SEARCH_FIELDS, 'ABC')
+    )
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.index_name} ON products_product USING GIN (({self.vector}))'
+        )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {self.index_name}')
+
+    def search(self, queryset, query):
+        if not tokenize(query):
+            return no_matches(queryset)
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.filter(
+            RawSQL(f'({self.vector}) @@ {tsquery}', (query,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank_cd({self.vector}, {tsquery})', (query,), output_field=FloatField())
+        )
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {self.index_name}')
+        return Product.objects.count()
+
+
+class LikeSearchBackend:
+    """Unindexed fallback with the same semantics as the old SearchFilter."""
+
+    def create_index(self, schema_editor):
+        pass
+
+    def drop_index(self, schema_editor):
+        pass
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return no_matches(queryset)
+        for term in terms:
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, LikeSearchBackend)()
+
+
+def search_products(queryset, query, fuzzy=False):
+    """
+    Filter queryset to products matching query, annotated with `search_rank` (higher is better).
+    With fuzzy=True, a query without matches falls back to trigram similarity (trigrams.py).
+    """
+    results = get_search_backend().search(queryset, query)
+    if fuzzy and not results.exists():
+        return fuzzy_search(queryset, query)
+    return results
+
+
+class FuzzySearchFilter(filters.SearchFilter):
+    """SearchFilter that falls back to trigram similarity when the exact search finds nothing"""
+
+    def filter_queryset(self, request, queryset, view):
+        results = super().filter_queryset(request, queryset, view)
+        terms = self.get_search_terms(request)
+        if terms and not results.exists():
+            return fuzzy_search(queryset, ' '.join(terms))
+        return results
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """Orders full-text and fuzzy results by relevance unless the client asks for another ordering."""
+    search_param = 'q'
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get(self.search_param, '').strip():
+            return ['-search_rank']
+        return super().get_default_ordering(view)
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank']
+        return super().get_ordering(request, queryset, view)
@@ -1,48 +1,65 @@
 from rest_framework import serializers
+from .fieldsets import SparseFieldsetMixin
+from .images import image_info_urls
 from .models import Category, Brand, Product, ProductImage, ProductAttribute
 
 class CategoryTreeSerializer(serializers.ModelSerializer):
+    """
+    Serializes a category tree that was loaded up front. Expects `tree_children`
+    (parent id -> child categories) in the context, so no queries run per node.
+    """
     children = serializers.SerializerMethodField()
-    products_count = serializers.ReadOnlyField(source='get_products_count')
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'image', 'products_count', 'children']
     
     def get_children(self, obj):
-        if obj.children.exists():
-            return CategoryTreeSerializer(obj.children.filter(is_active=True), many=True).data
+        children = self.context.get('tree_children', {}).get(obj.id, [])
+        if children:
+            return CategoryTreeSerializer(children, many=True, context=self.context).data
         return []
 
-class CategorySerializer(serializers.ModelSerializer):
-    products_count = serializers.ReadOnlyField(source='get_products_count')
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     parent_name = serializers.CharField(source='parent.name', read_only=True)
+    image_derivatives = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'image', 'parent', 'parent_name', 'products_count']
+        fields = ['id', 'name', 'slug', 'description', 'image', 'image_derivatives', 'parent', 'parent_name', 'products_count']
+        read_only_fields = ['products_count']
+
+    def get_image_derivatives(self, obj):
+        return image_info_urls(obj.image_info, self.context.get('request'))
+
+class BrandSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    logo_derivatives = serializers.SerializerMethodField()
 
-class BrandSerializer(serializers.ModelSerializer):
-    products_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'slug', 'logo', 'description', 'products_count']
-    
-    def get_products_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+        fields = ['id', 'name', 'slug', 'logo', 'logo_derivatives', 'description', 'products_count']
+        read_only_fields = ['products_count']
+
+    def get_logo_derivatives(self, obj):
+        return image_info_urls(obj.logo_info, self.context.get('request'))
+
+class ProductImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    derivatives = serializers.SerializerMethodField()
 
-class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary']
+        fields = ['id', 'image', 'derivatives', 'alt_text', 'is_primary']
+
+    def get_derivatives(self, obj):
+        return image_info_urls(obj.image_info, self.context.get('request'))
 
-class ProductAttributeSerializer(serializers.ModelSerializer):
+class ProductAttributeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductAttribute
         fields = ['id', 'name', 'value']
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ['category', 'brand', 'images']
     images = ProductImageSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
@@ -58,7 +75,8 @@ class ProductListSerializer(serializers.ModelSerializer):
             'average_rating', 'stock_quantity', 'featured'
         ]
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ['category', 'brand', 'images', 'attributes']
     images = ProductImageSerializer(many=True, read_only=True)
     attributes = ProductAttributeSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
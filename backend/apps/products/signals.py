@@ -0,0 +1,149 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from . import images, object_cache
+from .cache import bump_catalog_version_on_commit
+from .models import Brand, Category, CategoryClosure, Product, ProductAttribute, ProductImage
+from .search import get_search_backend
+
+
+@receiver(post_delete, sender=Product)
+def update_counters_on_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        Product.adjust_counters(instance.category_id, instance.brand_id, -1)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_ancestors(sender, instance, **kwargs):
+    instance._ancestor_ids = list(
+        CategoryClosure.objects.filter(descendant_id=instance.pk, depth__gt=0).values_list('ancestor_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def update_counters_on_category_delete(sender, instance, **kwargs):
+    # The cascade removes the closure rows before the products' post_delete
+    # runs, so their decrements never reach the ancestors; recount those instead
+    CategoryClosure.recount(getattr(instance, '_ancestor_ids', []))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+for model in (Product, Category, Brand, ProductImage, ProductAttribute):
+    post_save.connect(bump_catalog_version_on_commit, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+    post_delete.connect(bump_catalog_version_on_commit, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def touch_product(sender, instance, **kwargs):
+    Product.touch(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def generate_image_derivatives(sender, instance, **kwargs):
+    for field_name in images.IMAGE_FIELDS[(sender._meta.app_label, sender.__name__)]:
+        if images.needs_processing(instance, field_name):
+            images.schedule(instance, field_name)
+
+
+# Object cache invalidation. pre_save remembers what a save can move away from
+# (old slug, old category and brand, old ancestors) so both sides are dropped.
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product(sender, instance, **kwargs):
+    instance._cached_previous = None
+    if instance.pk:
+        instance._cached_previous = Product.objects.filter(pk=instance.pk).values_list(
+            'slug', 'is_active', 'category_id', 'brand_id'
+        ).first()
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    previous = getattr(instance, '_cached_previous', None)
+    object_cache.invalidate('product', [instance.slug, previous and previous[0]])
+    # Product.save() only touches the counters when one of these changes
+    if previous is None or previous[1:] != (instance.is_active, instance.category_id, instance.brand_id):
+        object_cache.invalidate_brands([instance.brand_id, previous and previous[3]])
+        object_cache.invalidate_categories([instance.category_id, previous and previous[2]])
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product(sender, instance, **kwargs):
+    object_cache.invalidate('product', [instance.slug])
+    if instance.is_active:
+        object_cache.invalidate_brands([instance.brand_id])
+        object_cache.invalidate_categories([instance.category_id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def invalidate_cached_parent_product(sender, instance, **kwargs):
+    object_cache.invalidate_products(pk=instance.product_id)
+
+
+@receiver(pre_save, sender=Brand)
+def remember_previous_brand(sender, instance, **kwargs):
+    instance._cached_previous = None
+    if instance.pk:
+        instance._cached_previous = Brand.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Brand)
+def invalidate_cached_brand(sender, instance, **kwargs):
+    previous = getattr(instance, '_cached_previous', None)
+    object_cache.invalidate('brand', [instance.slug, previous])
+    if previous and previous != instance.slug:
+        # Product entries refer to their brand by slug
+        object_cache.invalidate_products(brand_id=instance.pk)
+
+
+@receiver(post_delete, sender=Brand)
+def invalidate_deleted_brand(sender, instance, **kwargs):
+    object_cache.invalidate('brand', [instance.slug])
+
+
+@receiver(pre_save, sender=Category)
+def remember_previous_category(sender, instance, **kwargs):
+    instance._cached_previous = None
+    if instance.pk:
+        previous = Category.objects.filter(pk=instance.pk).values_list('slug', 'name', 'parent_id').first()
+        if previous:
+            ancestors = CategoryClosure.objects.filter(descendant_id=instance.pk).values_list('ancestor_id', flat=True)
+            instance._cached_previous = previous + (list(ancestors),)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_cached_category(sender, instance, **kwargs):
+    previous = getattr(instance, '_cached_previous', None)
+    if previous is None:
+        object_cache.invalidate('category', [instance.slug])
+        return
+    slug, name, parent_id, ancestors = previous
+    object_cache.invalidate('category', [instance.slug, slug])
+    if parent_id != instance.parent_id:
+        # Moving a subtree changes the counters of the old and the new ancestors
+        object_cache.invalidate_categories(ancestors, ancestors=False)
+        object_cache.invalidate_categories([instance.pk])
+    if name != instance.name:
+        # Children show their parent's name
+        object_cache.invalidate('category', Category.objects.filter(parent_id=instance.pk).values_list('slug', flat=True))
+    if slug != instance.slug:
+        # Product entries refer to their category by slug
+        object_cache.invalidate_products(category_id=instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_deleted_category(sender, instance, **kwargs):
+    object_cache.invalidate('category', [instance.slug])
+    # Their counters included the deleted subtree (see update_counters_on_category_delete)
+    object_cache.invalidate_categories(getattr(instance, '_ancestor_ids', []), ancestors=False)
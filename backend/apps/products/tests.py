@@ -1,3 +1,1501 @@
-from django.test import TestCase
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db.models import F
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from apps.authentication.models import User
+from apps.orders.models import Order, OrderItem
+from ecommerce_project.replicas import STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from . import cache as catalog_cache, images, object_cache
+from .autocomplete import PrefixIndex, autocomplete_index
+from .cache import bump_catalog_version, cache_catalog_response, get_catalog_version
+from .facets import get_facets
+from .importers import Checkpoint, ProductImporter, read_rows, run_import
+from .local_index import INDEXES, LocalIndex, warm_up
+from .models import (
+    Brand, CatalogVersion, Category, CategoryClosure, Product, ProductAttribute, ProductImage, RelatedProduct,
+)
+from .popularity import refresh_popularity
+from .recommendations import build_recommendations
+from .search import search_products
+from .trigrams import THRESHOLD, similarity, trigram_index, trigrams
+from .views import ProductListView
 
-# Create your tests here.
+
+def make_product(category, brand, name, **kwargs):
+    kwargs.setdefault('description', f'{name} description')
+    kwargs.setdefault('price', 100)
+    return Product.objects.create(name=name, category=category, brand=brand, **kwargs)
+
+
+class CatalogTestCase(TestCase):
+    """Starts every test with empty caches, since cached catalog responses outlive test transactions"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Indexes are built on demand in tests rather than in background threads
+        request_started.disconnect(warm_up, dispatch_uid='local_index_warm_up')
+
+    def setUp(self):
+        super().setUp()
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        # Create the version row up front so it does not show up in query counts
+        get_catalog_version()
+        self.client = APIClient()
+
+
+def closure(category):
+    """{ancestor name: depth} of a category"""
+    links = CategoryClosure.objects.filter(descendant=category).values_list('ancestor__name', 'depth')
+    return dict(links)
+
+
+class CategoryClosureTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Electronics')
+        self.audio = Category.objects.create(name='Audio', parent=self.root)
+        self.headphones = Category.objects.create(name='Headphones', parent=self.audio)
+        self.home = Category.objects.create(name='Home')
+
+    def test_insert_links_every_ancestor(self):
+        self.assertEqual(closure(self.headphones), {'Headphones': 0, 'Audio': 1, 'Electronics': 2})
+        self.assertEqual(closure(self.root), {'Electronics': 0})
+
+    def test_descendants_and_products(self):
+        brand = Brand.objects.create(name='Acme')
+        product = make_product(self.headphones, brand, 'Studio Cans')
+        make_product(self.home, brand, 'Lamp')
+
+        self.assertEqual(set(self.root.get_descendants()), {self.audio, self.headphones})
+        self.assertEqual(set(self.root.get_descendants(include_self=True)), {self.root, self.audio, self.headphones})
+        self.assertEqual(list(self.root.get_products()), [product])
+
+    def test_moving_a_subtree_relinks_descendants(self):
+        self.audio.parent = self.home
+        self.audio.save()
+
+        self.assertEqual(closure(self.headphones), {'Headphones': 0, 'Audio': 1, 'Home': 2})
+        self.assertEqual(closure(self.audio), {'Audio': 0, 'Home': 1})
+        self.assertEqual(list(self.root.get_descendants()), [])
+
+    def test_moving_to_the_top_level(self):
+        self.audio.parent = None
+        self.audio.save()
+
+        self.assertEqual(closure(self.headphones), {'Headphones': 0, 'Audio': 1})
+
+    def test_cannot_move_under_own_descendant(self):
+        self.root.parent = self.headphones
+        with self.assertRaises(ValueError):
+            self.root.save()
+        self.assertEqual(closure(self.headphones), {'Headphones': 0, 'Audio': 1, 'Electronics': 2})
+
+    def test_rebuild_restores_the_table(self):
+        expected = set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        CategoryClosure.objects.all().delete()
+
+        self.assertEqual(CategoryClosure.rebuild(), len(expected))
+        self.assertEqual(set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+
+class CategoryTreeViewTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = Category.objects.create(name='Electronics', sort_order=1)
+        self.audio = Category.objects.create(name='Audio', parent=self.root)
+        Category.objects.create(name='Headphones', parent=self.audio)
+        Category.objects.create(name='Hidden', parent=self.root, is_active=False)
+        Category.objects.create(name='Books', sort_order=0)
+
+    def names(self, nodes):
+        return [(node['name'], self.names(node['children'])) for node in nodes]
+
+    def test_tree_is_nested_and_skips_inactive_categories(self):
+        response = self.client.get('/api/categories/tree/')
+
+        results = response.json()['results']
+        self.assertEqual(self.names(results), [
+            ('Books', []),
+            ('Electronics', [('Audio', [('Headphones', [])])]),
+        ])
+
+    def test_max_depth_limits_levels(self):
+        response = self.client.get('/api/categories/tree/?max_depth=2')
+
+        self.assertEqual(self.names(response.json()['results']), [
+            ('Books', []),
+            ('Electronics', [('Audio', [])]),
+        ])
+
+    def test_query_count_does_not_grow_with_the_tree(self):
+        self.client.get('/api/categories/tree/')
+        caches['catalog'].clear()
+        # The catalog version and the categories
+        with self.assertNumQueries(2):
+            self.client.get('/api/categories/tree/')
+        for i in range(5):
+            Category.objects.create(name=f'Extra {i}', parent=self.audio)
+        caches['catalog'].clear()
+        with self.assertNumQueries(2):
+            self.client.get('/api/categories/tree/')
+
+
+class ProductCounterTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Electronics')
+        self.child = Category.objects.create(name='Audio', parent=self.root)
+        self.other = Category.objects.create(name='Home')
+        self.brand = Brand.objects.create(name='Acme')
+        self.other_brand = Brand.objects.create(name='Globex')
+
+    def counts(self):
+        categories = dict(Category.objects.values_list('name', 'products_count'))
+        brands = dict(Brand.objects.values_list('name', 'products_count'))
+        return categories, brands
+
+    def test_active_products_count_towards_category_ancestors_and_brand(self):
+        make_product(self.child, self.brand, 'Speaker')
+        make_product(self.child, self.brand, 'Draft', is_active=False)
+
+        self.assertEqual(self.counts(), (
+            {'Electronics': 1, 'Audio': 1, 'Home': 0},
+            {'Acme': 1, 'Globex': 0},
+        ))
+
+    def test_deactivating_and_moving_products(self):
+        product = make_product(self.child, self.brand, 'Speaker')
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.counts()[0]['Electronics'], 0)
+
+        product.is_active = True
+        product.category = self.other
+        product.brand = self.other_brand
+        product.save()
+        self.assertEqual(self.counts(), (
+            {'Electronics': 0, 'Audio': 0, 'Home': 1},
+            {'Acme': 0, 'Globex': 1},
+        ))
+
+    def test_deleting_a_product(self):
+        product = make_product(self.child, self.brand, 'Speaker')
+        product.delete()
+
+        self.assertEqual(self.counts(), (
+            {'Electronics': 0, 'Audio': 0, 'Home': 0},
+            {'Acme': 0, 'Globex': 0},
+        ))
+
+    def test_moving_a_subtree_moves_its_counts(self):
+        for i in range(2):
+            make_product(self.child, self.brand, f'Speaker {i}')
+        self.child.parent = self.other
+        self.child.save()
+
+        self.assertEqual(self.counts()[0], {'Electronics': 0, 'Audio': 2, 'Home': 2})
+
+    def test_deleting_a_category_updates_its_ancestors(self):
+        leaf = Category.objects.create(name='Headphones', parent=self.child)
+        for i in range(3):
+            make_product(self.child, self.brand, f'Speaker {i}')
+        make_product(leaf, self.brand, 'Cans')
+        make_product(self.root, self.other_brand, 'Cable')
+
+        self.child.delete()
+
+        self.assertEqual(self.counts(), (
+            {'Electronics': 1, 'Home': 0},
+            {'Acme': 0, 'Globex': 1},
+        ))
+
+    def test_reconcile_repairs_drift(self):
+        make_product(self.child, self.brand, 'Speaker')
+        Category.objects.update(products_count=7)
+        Brand.objects.update(products_count=7)
+
+        call_command('reconcile_catalog_counts', stdout=StringIO())
+
+        self.assertEqual(self.counts(), (
+            {'Electronics': 1, 'Audio': 1, 'Home': 0},
+            {'Acme': 1, 'Globex': 0},
+        ))
+
+    def test_reconcile_invalidates_cached_responses_only_after_a_repair(self):
+        make_product(self.child, self.brand, 'Speaker')
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_catalog_counts', stdout=StringIO())
+        self.assertEqual(get_catalog_version(), version)
+
+        Brand.objects.update(products_count=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_catalog_counts', stdout=StringIO())
+        self.assertGreater(get_catalog_version(), version)
+
+
+class CursorPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='Acme')
+        # Repeated prices exercise the id tie-breaker
+        self.products = [make_product(category, brand, f'Speaker {i:02}', price=10 + i % 4) for i in range(25)]
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            ids += [row['id'] for row in data['results']]
+            url, pages = data['next'], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, pages = self.walk('/api/products/?pagination=cursor&ordering=price')
+
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id))]
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 2)
+
+    def test_descending_ordering(self):
+        ids, _ = self.walk('/api/products/?pagination=cursor&ordering=-price')
+
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id), reverse=True)]
+        self.assertEqual(ids, expected)
+
+    def test_count_only_on_request(self):
+        data = self.client.get('/api/products/?pagination=cursor&include_count=true').json()
+
+        self.assertEqual(data['count'], 25)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/products/?cursor=garbage').status_code, 404)
+
+    def test_cursor_from_another_ordering_is_rejected(self):
+        next_url = self.client.get('/api/products/?pagination=cursor&ordering=price').json()['next']
+        cursor = next_url.split('cursor=')[1].split('&')[0]
+
+        self.assertEqual(self.client.get(f'/api/products/?cursor={cursor}&ordering=name').status_code, 404)
+
+    def test_card_view_with_every_ordering_field(self):
+        for field in ProductListView.ordering_fields:
+            ids, pages = self.walk(f'/api/products/?pagination=cursor&view=card&ordering=-{field}')
+            self.assertEqual(sorted(ids), sorted(p.id for p in self.products), field)
+            self.assertEqual(pages, 2)
+
+    def test_page_numbers_still_work(self):
+        data = self.client.get('/api/products/?page=2').json()
+
+        self.assertEqual(data['count'], 25)
+        self.assertEqual(len(data['results']), 5)
+
+
+class FullTextSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.by_name = make_product(self.category, self.brand, 'Wireless Headphones', description='Over-ear')
+        self.by_description = make_product(self.category, self.brand, 'Studio Monitor', description='Pairs with wireless gear')
+        make_product(self.category, self.brand, 'Desk Lamp')
+
+    def search(self, query, **params):
+        params['q'] = query
+        return self.client.get('/api/products/', params).json()
+
+    def names(self, data):
+        return [row['name'] for row in data['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.names(self.search('wireless')), ['Wireless Headphones', 'Studio Monitor'])
+
+    def test_prefixes_and_diacritics_match(self):
+        self.assertEqual(self.names(self.search('héadph')), ['Wireless Headphones'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.client.get('/api/products/', {'q': 'wireless" NEAR("headphones'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response.json()), ['Wireless Headphones'])
+
+    def test_queries_without_words_match_nothing(self):
+        results = search_products(Product.objects.all(), '!!!')
+
+        self.assertEqual(list(results.order_by('-search_rank')), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.by_description.name = 'Wireless Monitor'
+        self.by_description.description = '-'
+        self.by_description.save()
+        self.by_name.delete()
+
+        self.assertEqual(self.names(self.search('wireless')), ['Wireless Monitor'])
+
+    def test_ranked_search_ignores_cursor_pagination(self):
+        for i in range(20):
+            make_product(self.category, self.brand, f'Wireless Speaker {i}')
+
+        data = self.search('wireless', pagination='cursor')
+
+        self.assertEqual(data['count'], 22)
+        self.assertIn('page=2', data['next'])
+        self.assertEqual(data['results'][0]['name'], 'Wireless Headphones')
+
+    def test_search_with_explicit_ordering_can_use_cursors(self):
+        data = self.search('wireless', pagination='cursor', ordering='price')
+
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 2)
+
+
+class FacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = Category.objects.create(name='Electronics')
+        self.audio = Category.objects.create(name='Audio', parent=self.root)
+        self.home = Category.objects.create(name='Home')
+        self.acme = Brand.objects.create(name='Acme')
+        self.globex = Brand.objects.create(name='Globex')
+        make_product(self.audio, self.acme, 'Speaker', price=15, stock_quantity=3)
+        make_product(self.audio, self.globex, 'Amp', price=40)
+        make_product(self.root, self.acme, 'Cable', price=5, stock_quantity=1)
+        make_product(self.home, self.globex, 'Lamp', price=60)
+
+    def facets(self, **params):
+        return self.client.get('/api/filters/', params).json()
+
+    def counts(self, items):
+        return {item['name']: item['count'] for item in items}
+
+    def test_categories_roll_up_to_ancestors(self):
+        data = self.facets()
+
+        self.assertEqual(self.counts(data['categories']), {'Audio': 2, 'Electronics': 3, 'Home': 1})
+        self.assertEqual(self.counts(data['brands']), {'Acme': 2, 'Globex': 2})
+        self.assertEqual(data['total'], 4)
+
+    def test_facets_follow_the_list_filters(self):
+        data = self.facets(category_slug=self.root.slug, max_price=20)
+
+        self.assertEqual(self.counts(data['categories']), {'Audio': 1, 'Electronics': 2})
+        self.assertEqual(self.counts(data['brands']), {'Acme': 2})
+        self.assertEqual(data['availability'], {'in_stock': 2, 'out_of_stock': 0})
+
+    def test_price_range_and_buckets(self):
+        data = self.facets()
+
+        self.assertEqual(data['price_range'], {'min_price': 5, 'max_price': 60})
+        buckets = data['price_buckets']
+        self.assertEqual(sum(bucket['count'] for bucket in buckets), 4)
+        self.assertLessEqual(float(buckets[0]['min']), 5)
+        self.assertGreater(float(buckets[-1]['max']), 60)
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        # The catalog version and the facet queries
+        with self.assertNumQueries(9):
+            self.facets()
+        for i in range(5):
+            category = Category.objects.create(name=f'Extra {i}', parent=self.root)
+            make_product(category, Brand.objects.create(name=f'Brand {i}'), f'Extra {i}')
+        caches['catalog'].clear()
+        with self.assertNumQueries(9):
+            self.facets()
+
+    def test_results_are_cached_per_filter_set(self):
+        self.facets(brand_slug=self.acme.slug, page=2)
+        with self.assertNumQueries(1):
+            self.facets(page=3, brand_slug=self.acme.slug)
+
+    def test_results_from_a_lagging_replica_are_not_cached(self):
+        params, computed = QueryDict('brand_slug=acme'), []
+
+        def get_queryset():
+            computed.append(True)
+            return Product.objects.filter(is_active=True)
+
+        with mock.patch('apps.products.facets.replica_is_current', return_value=False):
+            get_facets(params, get_queryset)
+        get_facets(params, get_queryset)
+        get_facets(params, get_queryset)
+
+        self.assertEqual(len(computed), 2)
+
+    def test_invalid_filters_are_rejected(self):
+        for params in [{'brand': 'not-a-brand'}, {'min_price': 'abc'}, {'max_price': 'NaN'}]:
+            self.assertEqual(self.client.get('/api/filters/', params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/products/', {'min_price': 'abc'}).status_code, 400)
+
+    def test_failures_fall_back_without_being_cached(self):
+        with mock.patch('apps.products.views.get_facets', side_effect=RuntimeError('boom')):
+            with self.assertLogs('apps.products.views', 'ERROR'):
+                data = self.facets()
+
+        self.assertEqual(data['total'], 0)
+        self.assertEqual(set(data) - {'error'}, set(self.facets()))
+        self.assertEqual(self.client.get('/api/filters/')['X-Cache'], 'HIT')
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.product = make_product(self.category, self.brand, 'Speaker', featured=True)
+
+    def get(self, url='/api/featured/'):
+        return self.client.get(url)
+
+    def test_responses_are_cached_until_a_write_commits(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Loud Speaker'
+            self.product.save()
+
+        response = self.get()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['name'], 'Loud Speaker')
+
+    def test_responses_are_cached_per_scheme(self):
+        ProductImage.objects.create(product=self.product, image='products/front.jpg')
+        self.get()
+
+        response = self.client.get('/api/featured/', secure=True)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['results'][0]['images'][0]['image'].startswith('https://'))
+
+    def test_responses_from_a_lagging_replica_are_not_cached(self):
+        # 'default' stands in for a replica that has not seen the latest bump yet
+        primary_version = get_catalog_version() + 1
+        with mock.patch.object(catalog_cache, 'current_replica', return_value='default'), \
+                mock.patch.object(catalog_cache, 'get_catalog_version', return_value=primary_version):
+            self.assertEqual(self.get()['X-Cache'], 'MISS')
+            self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+        with mock.patch.object(catalog_cache, 'current_replica', return_value='default'):
+            self.get()
+            self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+    def test_version_is_bumped_on_commit_only(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Brand.objects.create(name='Globex')
+            self.assertEqual(get_catalog_version(), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_version_is_shared_through_the_database(self):
+        self.get()
+        # Another process bumping the version leaves this process's cache untouched
+        CatalogVersion.objects.update(version=F('version') + 1)
+
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+    def test_missing_version_row_is_recreated(self):
+        CatalogVersion.objects.all().delete()
+        bump_catalog_version()
+
+        self.assertEqual(CatalogVersion.objects.count(), 1)
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.product = make_product(self.category, self.brand, 'Speaker')
+        self.url = f'/api/products/{self.product.slug}/'
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_product_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            revalidated = self.revalidate(self.url, response)
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_product_changes_change_the_etag(self):
+        response = self.client.get(self.url)
+        make_product(self.category, self.brand, 'Amp')
+
+        # The nested category's counter is part of the payload
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_query_string_is_part_of_the_etag(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(self.revalidate(f'{self.url}?fields=name', response).status_code, 200)
+
+    def test_category_detail(self):
+        url = f'/api/categories/{self.category.slug}/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        self.category.description = 'Speakers and amps'
+        self.category.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_collection_etag_follows_the_catalog_version(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(self.revalidate('/api/products/', response).status_code, 304)
+
+        bump_catalog_version()
+        self.assertEqual(self.revalidate('/api/products/', response).status_code, 200)
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get('/api/products/missing/').status_code, 404)
+
+
+class ProductCardTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.product = make_product(self.category, self.brand, 'Speaker', price=200, discount_price=150)
+
+    def cards(self, **params):
+        return self.client.get('/api/products/', {'view': 'card', **params}).json()['results']
+
+    def test_card_fields(self):
+        ProductImage.objects.create(product=self.product, image='products/side.jpg')
+        ProductImage.objects.create(
+            product=self.product, image='products/front.jpg', is_primary=True,
+            image_info={'renditions': {'thumbnail': 'derivatives/products/front_thumbnail.webp'}}
+        )
+
+        card = self.cards()[0]
+
+        self.assertEqual(card['current_price'], 150)
+        self.assertEqual(card['discount_percentage'], 25)
+        self.assertEqual(card['category'], {'id': self.category.id, 'name': 'Audio', 'slug': self.category.slug})
+        self.assertEqual(card['brand']['name'], 'Acme')
+        self.assertTrue(card['image'].endswith('/products/front.jpg'))
+        self.assertTrue(card['thumbnail'].endswith('/derivatives/products/front_thumbnail.webp'))
+
+    def test_cards_without_images_or_reviews(self):
+        card = self.cards()[0]
+
+        self.assertIsNone(card['image'])
+        self.assertIsNone(card['thumbnail'])
+        self.assertEqual(card['average_rating'], 0)
+
+    def test_filters_apply_to_cards(self):
+        other = Category.objects.create(name='Home')
+        make_product(other, self.brand, 'Lamp')
+
+        self.assertEqual([card['name'] for card in self.cards(category_slug=other.slug)], ['Lamp'])
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # The catalog version, the count and the rows
+        with self.assertNumQueries(3):
+            self.cards()
+        for i in range(10):
+            product = make_product(self.category, self.brand, f'Speaker {i}')
+            ProductImage.objects.create(product=product, image=f'products/{i}.jpg')
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.cards()), 11)
+
+
+class SparseFieldsetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Audio')
+        self.brand = Brand.objects.create(name='Acme')
+        self.product = make_product(self.category, self.brand, 'Speaker')
+        ProductImage.objects.create(product=self.product, image='products/front.jpg')
+
+    def first(self, **params):
+        return self.client.get('/api/products/', params).json()['results'][0]
+
+    def test_fields_keep_only_the_listed_paths(self):
+        row = self.first(fields='id,name,category.name')
+
+        self.assertEqual(row, {'id': self.product.id, 'name': 'Speaker', 'category': {'name': 'Audio'}})
+
+    def test_omit_drops_fields(self):
+        data = self.client.get(f'/api/products/{self.product.slug}/', {'omit': 'description,images,category.parent_name'}).json()
+
+        self.assertNotIn('description', data)
+        self.assertNotIn('images', data)
+        self.assertNotIn('parent_name', data['category'])
+        self.assertIn('brand', data)
+
+    def test_expand_collapses_other_relations(self):
+        row = self.first(expand='category')
+
+        self.assertEqual(row['category']['name'], 'Audio')
+        self.assertEqual(row['brand'], self.brand.id)
+        self.assertNotIn('images', row)
+
+    def test_only_requested_relations_are_loaded(self):
+        # The catalog version, the count, the rows and the images
+        with self.assertNumQueries(4):
+            self.first()
+        with self.assertNumQueries(3):
+            self.first(fields='id,name,brand.name')
+
+
+def image_upload(name='front.png', size=(640, 480), color=(200, 30, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImagePipelineTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_PIPELINE_SYNC=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = make_product(Category.objects.create(name='Audio'), Brand.objects.create(name='Acme'), 'Speaker')
+
+    def add_image(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(product=self.product, image=image_upload(**kwargs))
+
+    def test_derivatives_are_built_after_commit(self):
+        image = self.add_image()
+        image.refresh_from_db()
+
+        info = image.image_info
+        self.assertEqual((info['source'], info['width'], info['height']), (image.image.name, 640, 480))
+        self.assertEqual(info['dominant_color'], '#c81e1e')
+        self.assertEqual(set(info['renditions']), set(images.RENDITIONS))
+        with default_storage.open(info['renditions']['thumbnail']) as handle:
+            self.assertEqual(Image.open(handle).size, (200, 200))
+        with default_storage.open(info['renditions']['card']) as handle:
+            self.assertEqual(Image.open(handle).size, (480, 360))
+
+    def test_product_payload_lists_renditions(self):
+        self.add_image()
+
+        data = self.client.get(f'/api/products/{self.product.slug}/').json()
+
+        derivatives = data['images'][0]['derivatives']
+        self.assertEqual(derivatives['width'], 640)
+        self.assertTrue(derivatives['renditions']['thumbnail'].endswith('_thumbnail.webp'))
+
+    def test_derivatives_change_the_category_etag(self):
+        category = self.product.category
+        with mock.patch.object(images, 'schedule'):
+            category.image = image_upload()
+            category.save()
+        url = f'/api/categories/{category.slug}/'
+        response = self.client.get(url)
+        self.assertIsNone(response.json()['image_derivatives'])
+
+        images.process_image_field('products.Category', category.pk, 'image')
+
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.json()['image_derivatives']['width'], 640)
+
+    def test_renditions_of_a_deleted_image_are_removed(self):
+        image = self.add_image()
+        ProductImage.objects.filter(pk=image.pk).update(image_info={})
+        build, built = images.build_derivatives, []
+
+        def build_and_delete(source):
+            built.append(build(source))
+            ProductImage.objects.filter(pk=image.pk).delete()
+            return built[0]
+
+        with mock.patch.object(images, 'build_derivatives', build_and_delete):
+            self.assertIsNone(images.process_image_field('products.ProductImage', image.pk, 'image'))
+        for path in built[0]['renditions'].values():
+            self.assertFalse(default_storage.exists(path))
+
+    def test_background_failures_are_logged(self):
+        image = self.add_image()
+        default_storage.delete(image.image.name)
+
+        with self.assertLogs('apps.products.images', 'ERROR'):
+            with mock.patch.object(images.connection, 'close'):
+                images.process_in_background('products.ProductImage', image.pk, 'image')
+
+
+class CatalogImportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def source(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            handle.write(text)
+        return path
+
+    def run_command(self, entity, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', entity, path, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def import_catalog(self):
+        self.run_command('brands', self.source('brands.csv', 'name,slug\nAcme,acme\nGlobex,globex\n'))
+        self.run_command('categories', self.source('categories.jsonl', '\n'.join([
+            '{"name": "Electronics", "slug": "electronics"}',
+            '{"name": "Audio", "slug": "audio", "parent": "electronics"}',
+            '{"name": "Home", "slug": "home"}',
+        ])))
+        return self.run_command('products', self.source('products.csv', (
+            'name,slug,price,category,brand\n'
+            'Wireless Speaker,speaker,100,audio,acme\n'
+            'Amp,amp,250,audio,globex\n'
+            'Lamp,lamp,40,home,acme\n'
+            'Broken,broken,abc,audio,acme\n'
+            'Orphan,orphan,10,missing,acme\n'
+        )))
+
+    def test_import_builds_derived_data(self):
+        _, stderr = self.import_catalog()
+
+        self.assertEqual(stderr.splitlines(), ["row 4: invalid price: 'abc'", "row 5: unknown category 'missing'"])
+        self.assertEqual(closure(Category.objects.get(slug='audio')), {'Audio': 0, 'Electronics': 1})
+        self.assertEqual(dict(Category.objects.values_list('slug', 'products_count')), {'electronics': 2, 'audio': 2, 'home': 1})
+        self.assertEqual(dict(Brand.objects.values_list('slug', 'products_count')), {'acme': 2, 'globex': 1})
+        data = self.client.get('/api/products/', {'q': 'wireless'}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['speaker'])
+
+    def test_update_moves_categories_and_their_counts(self):
+        self.import_catalog()
+
+        self.run_command('categories', self.source('move.csv', 'name,slug,parent\nAudio,audio,home\n'), update=True)
+
+        self.assertEqual(closure(Category.objects.get(slug='audio')), {'Audio': 0, 'Home': 1})
+        self.assertEqual(dict(Category.objects.values_list('slug', 'products_count')), {'electronics': 0, 'audio': 2, 'home': 3})
+
+    def test_child_rows_touch_their_products(self):
+        self.import_catalog()
+        Product.objects.update(updated_at='2020-01-01T00:00:00Z')
+
+        self.run_command('attributes', self.source('attributes.csv', 'product,name,value\nspeaker,Color,Red\n'))
+        self.run_command('images', self.source('images.csv', 'product,image\namp,products/amp.jpg\n'))
+
+        touched = Product.objects.filter(updated_at__year__gt=2020).values_list('slug', flat=True)
+        self.assertEqual(set(touched), {'speaker', 'amp'})
+        self.assertEqual(ProductAttribute.objects.get().value_key, 'red')
+        self.assertEqual(ProductImage.objects.get().product.slug, 'amp')
+
+    def test_interrupted_import_resumes_after_the_last_batch(self):
+        self.import_catalog()
+        path = self.source('more.csv', 'name,price,category,brand\n' + ''.join(
+            f'Cable {i},5,audio,acme\n' for i in range(5)
+        ))
+        checkpoint = Checkpoint(path, 'products')
+
+        def interrupt(consumed, written):
+            checkpoint.save(consumed)
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_import(ProductImporter(), read_rows(path), batch_size=2, on_batch=interrupt)
+        self.assertEqual(checkpoint.load(), 2)
+
+        stdout, _ = self.run_command('products', path, resume=True, batch_size=2)
+
+        self.assertIn('Resuming after row 2', stdout)
+        self.assertEqual(Product.objects.filter(name__startswith='Cable').count(), 5)
+        self.assertFalse(os.path.exists(checkpoint.path))
+        self.assertEqual(Category.objects.get(slug='audio').products_count, 7)
+
+
+class ProductFeedTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        parent = Category.objects.create(name='Electronics')
+        category = Category.objects.create(name='Audio', parent=parent)
+        brand = Brand.objects.create(name='Acme & Sons')
+        self.speaker = make_product(category, brand, 'Speaker <2>', price=100, discount_price=80, stock_quantity=3)
+        ProductImage.objects.create(product=self.speaker, image='products/side.jpg')
+        ProductImage.objects.create(product=self.speaker, image='products/front.jpg', is_primary=True)
+        self.retired = make_product(category, brand, 'Old Speaker', is_active=False)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def csv_rows(self, **params):
+        response = self.client.get('/api/feeds/products.csv', params)
+        return list(csv.DictReader(self.content(response).decode().splitlines()))
+
+    def test_xml_feed(self):
+        response = self.client.get('/api/feeds/products.xml')
+        self.assertEqual(response['Content-Type'], 'application/xml; charset=utf-8')
+
+        namespace = {'g': 'http://base.google.com/ns/1.0'}
+        items = ElementTree.fromstring(self.content(response)).findall('channel/item')
+        self.assertEqual(len(items), 1)
+        item = items[0]
+        self.assertEqual(item.find('g:title', namespace).text, 'Speaker <2>')
+        self.assertEqual(item.find('g:brand', namespace).text, 'Acme & Sons')
+        self.assertEqual(item.find('g:product_type', namespace).text, 'Electronics > Audio')
+        self.assertEqual(item.find('g:sale_price', namespace).text, '80.00 INR')
+        self.assertTrue(item.find('g:image_link', namespace).text.endswith('/media/products/front.jpg'))
+        self.assertEqual(len(item.findall('g:additional_image_link', namespace)), 1)
+
+    def test_csv_feed(self):
+        rows = self.csv_rows()
+
+        self.assertEqual([row['title'] for row in rows], ['Speaker <2>'])
+        self.assertEqual(rows[0]['availability'], 'in_stock')
+        self.assertEqual(rows[0]['link'], f'http://localhost:3000/products/{self.speaker.slug}')
+
+    def test_since_includes_deactivated_products(self):
+        Product.objects.filter(pk=self.speaker.pk).update(updated_at='2020-01-01T00:00:00Z')
+
+        rows = self.csv_rows(since='2021-01-01')
+
+        self.assertEqual([(row['id'], row['availability']) for row in rows], [(str(self.retired.id), 'out_of_stock')])
+        # Nothing but the id of an inactive product is published
+        self.assertEqual({key for key, value in rows[0].items() if value}, {'id', 'availability'})
+
+        response = self.client.get('/api/feeds/products.xml', {'since': '2021-01-01'})
+        self.assertNotIn(b'Old Speaker', self.content(response))
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get('/api/feeds/products.csv', {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/feeds/products.json').status_code, 404)
+
+    def test_gzip(self):
+        response = self.client.get('/api/feeds/products.csv', {'gzip': 'true'})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="products.csv.gz"')
+        self.assertIn(b'Speaker <2>', gzip.decompress(self.content(response)))
+
+    def test_export_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'feed.xml.gz')
+
+        call_command('export_catalog', path, gzip=True, chunk_size=1, stdout=StringIO())
+
+        with gzip.open(path) as handle:
+            self.assertEqual(len(ElementTree.parse(handle).findall('channel/item')), 1)
+
+
+class AttributeFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Apparel')
+        brand = Brand.objects.create(name='Acme')
+        self.products = {}
+        for name, color, size in [('Tee', 'Red', 'M'), ('Polo', 'red ', 'L'), ('Hoodie', 'Blue', 'M'), ('Cap', 'Green', None)]:
+            product = self.products[name] = make_product(category, brand, name)
+            ProductAttribute.objects.create(product=product, name='Color', value=color)
+            if size:
+                ProductAttribute.objects.create(product=product, name='Size', value=size)
+
+    def names(self, **params):
+        rows = self.client.get('/api/products/', {'ordering': 'name', **params}).json()['results']
+        return [row['name'] for row in rows]
+
+    def facet_counts(self, **params):
+        facets = self.client.get('/api/filters/', params).json()['attributes']
+        return {
+            facet['key']: {value['key']: (value['count'], value['selected']) for value in facet['values']}
+            for facet in facets
+        }
+
+    def test_values_are_matched_on_normalized_keys(self):
+        self.assertEqual(self.names(**{'attr[color]': 'RED'}), ['Polo', 'Tee'])
+
+    def test_values_of_one_attribute_are_ored_and_attributes_anded(self):
+        self.assertEqual(self.names(**{'attr[color]': 'red,blue'}), ['Hoodie', 'Polo', 'Tee'])
+        self.assertEqual(self.names(**{'attr[color]': 'red,blue', 'attr[size]': 'm'}), ['Hoodie', 'Tee'])
+        self.assertEqual(self.names(**{'attr[material]': 'cotton'}), [])
+
+    def test_facets_ignore_their_own_filter(self):
+        counts = self.facet_counts(**{'attr[color]': 'red'})
+
+        self.assertEqual(counts['color'], {'red': (2, True), 'blue': (1, False), 'green': (1, False)})
+        self.assertEqual(counts['size'], {'m': (1, False), 'l': (1, False)})
+
+    def test_facets_without_filters(self):
+        counts = self.facet_counts()
+
+        self.assertEqual(counts['color'], {'red': (2, False), 'blue': (1, False), 'green': (1, False)})
+        self.assertEqual(counts['size'], {'m': (2, False), 'l': (1, False)})
+
+    def test_attribute_changes_invalidate_cached_responses(self):
+        params = {'attr[color]': 'green'}
+        listing = self.client.get('/api/products/', params)
+        self.assertEqual(self.facet_counts()['color']['green'], (1, False))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAttribute.objects.create(product=self.products['Tee'], name='Color', value='Green')
+
+        self.assertEqual(self.client.get('/api/products/', params, HTTP_IF_NONE_MATCH=listing['ETag']).status_code, 200)
+        self.assertEqual(self.names(**params), ['Cap', 'Tee'])
+        self.assertEqual(self.facet_counts()['color']['green'], (2, False))
+
+
+class RecommendationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='Acme')
+        self.user = User.objects.create(username='shopper', email='shopper@example.com')
+        self.speaker, self.cable, self.amp, self.stand = [
+            make_product(category, brand, name) for name in ('Speaker', 'Cable', 'Amp', 'Stand')
+        ]
+
+    def order(self, *products, status='delivered'):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-{Order.objects.count() + 1}', total_amount=100,
+            status=status, payment_method='cod'
+        )
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=p, quantity=1, price=p.price) for p in products])
+        return order
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list('related__name', 'count'))
+
+    def test_full_build_ranks_by_co_occurrence(self):
+        self.order(self.speaker, self.cable)
+        self.order(self.speaker, self.cable, self.speaker)
+        self.order(self.speaker, self.amp)
+        self.order(self.speaker, self.stand, status='cancelled')
+
+        run = build_recommendations()
+
+        self.assertEqual((run.full, run.orders), (True, 3))
+        self.assertEqual(self.related(self.speaker), [('Cable', 2), ('Amp', 1)])
+        self.assertEqual(self.related(self.amp), [('Speaker', 1)])
+
+    def test_incremental_build_adds_new_orders(self):
+        self.order(self.speaker, self.cable)
+        build_recommendations()
+        self.order(self.speaker, self.amp)
+        self.order(self.speaker, self.amp)
+
+        run = build_recommendations()
+
+        self.assertEqual((run.full, run.orders), (False, 2))
+        self.assertEqual(self.related(self.speaker), [('Amp', 2), ('Cable', 1)])
+
+    def test_items_added_to_an_order_after_a_run_are_counted(self):
+        # A run that overlaps a checkout sees only part of the basket
+        order = self.order(self.speaker, self.cable)
+        build_recommendations()
+        OrderItem.objects.create(order=order, product=self.amp, quantity=1, price=self.amp.price)
+        OrderItem.objects.create(order=order, product=self.speaker, quantity=1, price=self.speaker.price)
+
+        run = build_recommendations()
+
+        self.assertEqual((run.full, run.orders), (False, 1))
+        self.assertEqual(self.related(self.speaker), [('Cable', 1), ('Amp', 1)])
+        self.assertEqual(self.related(self.cable), [('Speaker', 1), ('Amp', 1)])
+        self.assertEqual(build_recommendations().orders, 0)
+
+    def test_full_rebuild_drops_cancelled_orders(self):
+        order = self.order(self.speaker, self.cable)
+        build_recommendations()
+        Order.objects.filter(pk=order.pk).update(status='cancelled')
+
+        build_recommendations(full=True)
+
+        self.assertEqual(self.related(self.speaker), [])
+
+    def test_top_k(self):
+        self.order(self.speaker, self.cable, self.amp, self.stand)
+
+        build_recommendations(top_k=2)
+
+        self.assertEqual(len(self.related(self.speaker)), 2)
+
+    def test_related_endpoint(self):
+        self.order(self.speaker, self.cable)
+        self.order(self.speaker, self.cable, self.amp)
+        self.order(self.speaker, self.stand)
+        build_recommendations()
+        Product.objects.filter(pk=self.stand.pk).update(is_active=False)
+        url = f'/api/products/{self.speaker.slug}/related/'
+
+        self.assertEqual([card['name'] for card in self.client.get(url).json()['results']], ['Cable', 'Amp'])
+        self.assertEqual(len(self.client.get(url, {'limit': 1}).json()['results']), 1)
+        self.assertEqual(self.client.get(f'/api/products/{self.amp.slug}/related/').json()['results'][0]['name'], 'Speaker')
+        self.assertEqual(self.client.get('/api/products/missing/related/').status_code, 404)
+
+
+class PopularityTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='Acme')
+        self.user = User.objects.create(username='shopper', email='shopper@example.com')
+        self.speaker, self.cable, self.amp = [make_product(category, brand, name) for name in ('Speaker', 'Cable', 'Amp')]
+
+    def order(self, product, quantity, days_ago=0, status='delivered'):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-{Order.objects.count() + 1}', total_amount=100,
+            status=status, payment_method='cod'
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+
+    def popularity(self):
+        return dict(Product.objects.values_list('name', 'popularity'))
+
+    def test_sales_decay_with_age(self):
+        self.order(self.speaker, 4)
+        self.order(self.cable, 4, days_ago=30)
+        self.order(self.amp, 4, days_ago=365)
+        self.order(self.amp, 9, status='cancelled')
+
+        self.assertEqual(refresh_popularity(), 2)
+
+        self.assertEqual(self.popularity(), {'Speaker': 4, 'Cable': 2, 'Amp': 0})
+
+    def test_reviews_add_to_the_score(self):
+        Product.objects.filter(pk=self.amp.pk).update(rating_sum=50, review_count=10)
+
+        refresh_popularity()
+
+        self.assertEqual(self.popularity()['Amp'], 5)
+        self.assertEqual(refresh_popularity(), 0)
+
+    def test_refresh_changes_the_detail_etag(self):
+        url = f'/api/products/{self.speaker.slug}/'
+        response = self.client.get(url)
+        self.order(self.speaker, 2)
+
+        refresh_popularity()
+
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.json()['popularity'], 2)
+
+    def test_ordering_by_popularity(self):
+        self.order(self.cable, 2)
+        self.order(self.amp, 1)
+        call_command('refresh_popularity', stdout=StringIO())
+
+        rows = self.client.get('/api/products/', {'ordering': '-popularity', 'view': 'card'}).json()['results']
+
+        self.assertEqual([row['name'] for row in rows], ['Cable', 'Amp', 'Speaker'])
+
+
+class AutocompleteTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        audio = Category.objects.create(name='Audio')
+        samsung = Brand.objects.create(name='Samsung')
+        make_product(audio, samsung, 'Samsung Galaxy S24', popularity=5)
+        make_product(audio, samsung, 'Galaxy Buds', popularity=9)
+        make_product(audio, samsung, 'Galaxy Hidden', is_active=False)
+        make_product(audio, Brand.objects.create(name='Sony'), 'Sony Héadphones')
+        autocomplete_index.rebuild()
+
+    def suggest(self, q, **params):
+        return self.client.get('/api/autocomplete/', {'q': q, **params}).json()
+
+    def names(self, suggestions):
+        return [item['name'] for item in suggestions]
+
+    def test_matches_any_word_ranked_by_popularity(self):
+        data = self.suggest('gal')
+
+        self.assertEqual(self.names(data['products']), ['Galaxy Buds', 'Samsung Galaxy S24'])
+        self.assertEqual(data['brands'], [])
+
+    def test_normalizes_accents_case_and_punctuation(self):
+        self.assertEqual(self.names(self.suggest('HEADPH')['products']), ['Sony Héadphones'])
+        self.assertEqual(self.names(self.suggest('  s-o ')['brands']), [])
+        self.assertEqual(self.names(self.suggest('so')['brands']), ['Sony'])
+
+    def test_brands_and_categories_rank_by_product_count(self):
+        data = self.suggest('s')
+
+        self.assertEqual(self.names(data['brands']), ['Samsung', 'Sony'])
+        self.assertEqual(self.names(self.suggest('aud')['categories']), ['Audio'])
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.suggest('galaxy', limit=1)['products']), 1)
+        self.assertEqual(self.suggest('', limit='x'), {'products': [], 'brands': [], 'categories': []})
+
+    def test_prefix_index_matches_a_linear_scan(self):
+        words = ['alpha', 'beta', 'gamma', 'delta', 'alpine', 'bet', 'gam']
+        entries = [(f'{words[i % 7]} {words[i * 3 % 7]}', i % 5, i) for i in range(60)]
+        index = PrefixIndex(entries)
+
+        for prefix in ['a', 'al', 'alp', 'bet', 'g', 'delta a', 'z', '']:
+            matching = [
+                (-weight, len(name), name, payload) for name, weight, payload in entries
+                if any(key.startswith(prefix) for key in [name, name.split(' ', 1)[1]])
+            ]
+            expected = [payload for *_, payload in sorted(matching)[:7]]
+            self.assertEqual(index.search(prefix, 7), expected, prefix)
+
+
+class LocalIndexTests(TestCase):
+    def setUp(self):
+        self.builds = 0
+        self.index = LocalIndex(self.build, 'test-index')
+        self.addCleanup(INDEXES.remove, self.index)
+        self.refresh = mock.patch.object(self.index, 'refresh_in_background', side_effect=self.index.rebuild)
+        self.refresh.start()
+        self.addCleanup(self.refresh.stop)
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    @override_settings(LOCAL_INDEX_REFRESH_SECONDS=0)
+    def test_rebuilt_when_the_catalog_version_changes(self):
+        self.assertEqual(self.index.get(), 1)
+        self.assertEqual(self.index.get(), 1)
+
+        bump_catalog_version()
+
+        self.assertEqual(self.index.get(), 2)
+
+    @override_settings(LOCAL_INDEX_REFRESH_SECONDS=0)
+    def test_indexes_built_on_a_lagging_replica_are_refreshed(self):
+        with mock.patch('apps.products.local_index.replica_is_current', return_value=False):
+            self.assertEqual(self.index.get(), 1)
+
+        self.assertEqual(self.index.get(), 2)
+        self.assertEqual(self.index.get(), 2)
+
+    @override_settings(LOCAL_INDEX_REFRESH_SECONDS=3600)
+    def test_rebuilds_are_throttled(self):
+        self.index.get()
+        bump_catalog_version()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.get(), 1)
+
+
+class FuzzySearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        phones = Category.objects.create(name='Phones')
+        samsung = Brand.objects.create(name='Samsung')
+        make_product(phones, samsung, 'Galaxy S24 Ultra')
+        make_product(phones, samsung, 'Galaxy Tab')
+        make_product(phones, Brand.objects.create(name='Apple'), 'iPhone Ultra Case')
+        make_product(phones, samsung, 'Retired Galaxy', is_active=False)
+        trigram_index.rebuild()
+
+    def names(self, **params):
+        return [row['name'] for row in self.client.get('/api/products/', params).json()['results']]
+
+    def test_similarity(self):
+        self.assertGreaterEqual(similarity(trigrams('samsung'), trigrams('samsnug')), THRESHOLD)
+        self.assertLess(similarity(trigrams('samsung'), trigrams('apple')), THRESHOLD)
+
+    def test_misspelled_queries_fall_back_to_trigrams(self):
+        self.assertEqual(self.names(q='galxy ultr'), ['Galaxy S24 Ultra', 'iPhone Ultra Case', 'Galaxy Tab'])
+        self.assertEqual(set(self.names(q='samsnug')), {'Galaxy S24 Ultra', 'Galaxy Tab'})
+
+    def test_search_parameter_falls_back_too(self):
+        self.assertEqual(set(self.names(search='galaxi')), {'Galaxy S24 Ultra', 'Galaxy Tab'})
+
+    def test_exact_matches_skip_the_fallback(self):
+        self.assertEqual(self.names(q='tab'), ['Galaxy Tab'])
+        self.assertEqual(self.names(q='zzzzzz'), [])
+
+    def test_pruning_finds_every_word_a_linear_scan_finds(self):
+        index = trigram_index.get()
+        for token in ['galxy', 'ultr', 'samsnug', 'iphone', 'cse', 'tabb']:
+            query = trigrams(token)
+            expected = sorted(
+                (score, i) for i, word in enumerate(index.words)
+                if (score := similarity(query, trigrams(word))) >= THRESHOLD
+            )
+            self.assertEqual(sorted(index.similar_words(token)), expected, token)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def handle(self, request, status=200):
+        """(database products are read from, database users are read from, response)"""
+        routed = {}
+
+        def get_response(request):
+            routed['products'] = self.router.db_for_read(Product)
+            routed['users'] = self.router.db_for_read(User)
+            return HttpResponse(status=status)
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return routed['products'], routed['users'], response
+
+    def test_safe_requests_read_catalog_apps_from_replicas(self):
+        self.assertEqual(self.handle(self.factory.get('/api/products/'))[:2], ('replica1', 'default'))
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    @override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+    def test_one_replica_serves_the_whole_request(self):
+        def get_response(request):
+            routed.update(self.router.db_for_read(Product) for _ in range(20))
+            routed.add(self.router.db_for_read(Category))
+            self.assertEqual(self.router.db_for_read(CatalogVersion), 'default')
+            return HttpResponse()
+
+        for _ in range(10):
+            routed = set()
+            ReplicaRoutingMiddleware(get_response)(self.factory.get('/api/products/'))
+            self.assertEqual(len(routed), 1)
+            self.assertIn(routed.pop(), ['replica1', 'replica2'])
+
+    def test_writes_stick_the_client_to_the_primary(self):
+        *_, response = self.handle(self.factory.post('/api/cart/add/'))
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        request = self.factory.get('/api/products/')
+        request.COOKIES[STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.handle(request)[0], 'default')
+
+    def test_failed_writes_do_not_stick(self):
+        *_, response = self.handle(self.factory.post('/api/cart/add/'), status=400)
+
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_nothing_happens_without_replicas(self):
+        self.assertEqual(self.handle(self.factory.get('/api/products/'))[0], 'default')
+        self.assertNotIn(STICKY_COOKIE, self.handle(self.factory.post('/api/cart/add/'))[2].cookies)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertIs(self.router.allow_migrate('replica1', 'products'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'products'))
+
+
+class ObjectCacheTests(CatalogTestCase):
+    """Runs against a cache shared between processes, where invalidation is per object"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+        settings_override = override_settings(CACHES={**settings.CACHES, 'catalog': shared})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+        object_cache._local.clear()
+        self.root = Category.objects.create(name='Electronics')
+        self.audio = Category.objects.create(name='Audio', parent=self.root)
+        self.brand = Brand.objects.create(name='Acme')
+        self.speaker = make_product(self.audio, self.brand, 'Speaker')
+        self.lamp = make_product(self.root, self.brand, 'Lamp')
+
+    def get(self, obj, **params):
+        kind = 'products' if isinstance(obj, Product) else 'categories'
+        return self.client.get(f'/api/{kind}/{obj.slug}/', params)
+
+    def test_local_then_shared_hits(self):
+        self.assertEqual(self.get(self.speaker)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.speaker)['X-Cache'], 'HIT-LOCAL')
+        object_cache._local.clear()
+        response = self.get(self.speaker)
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['brand']['name'], 'Acme')
+        self.assertEqual(object_cache.get_stats(), {'HIT-LOCAL': 1, 'HIT': 1, 'MISS': 1})
+
+    def test_sparse_requests_bypass_the_cache(self):
+        self.assertNotIn('X-Cache', self.get(self.speaker, fields='name'))
+
+    def test_entries_built_on_a_lagging_replica_are_not_stored(self):
+        primary_version = get_catalog_version() + 1
+        with mock.patch.object(catalog_cache, 'current_replica', return_value='default'), \
+                mock.patch.object(object_cache, 'get_catalog_version', return_value=primary_version):
+            self.assertEqual(self.get(self.speaker)['X-Cache'], 'MISS')
+            self.assertEqual(self.get(self.speaker)['X-Cache'], 'MISS')
+
+    def test_saves_invalidate_only_affected_objects(self):
+        self.get(self.speaker), self.get(self.lamp)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.speaker.price = 120
+            self.speaker.save()
+
+        response = self.get(self.speaker)
+        self.assertEqual((response['X-Cache'], response.json()['price']), ('MISS', '120.00'))
+        self.assertEqual(self.get(self.lamp)['X-Cache'], 'HIT-LOCAL')
+
+    def test_nested_objects_are_composed_on_read(self):
+        self.get(self.speaker)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = 'Acme Audio'
+            self.brand.save()
+
+        response = self.get(self.speaker)
+        self.assertEqual(response['X-Cache'], 'HIT-LOCAL')
+        self.assertEqual(response.json()['brand']['name'], 'Acme Audio')
+
+    def test_counter_changes_invalidate_ancestors(self):
+        self.assertEqual(self.get(self.root).json()['products_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(self.audio, self.brand, 'Amp')
+
+        self.assertEqual(self.get(self.root).json()['products_count'], 3)
+
+    def test_deleting_a_category_invalidates_its_ancestors(self):
+        self.get(self.root)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.audio.delete()
+
+        self.assertEqual(self.get(self.root).json()['products_count'], 1)
+        self.assertEqual(self.get(self.audio).status_code, 404)
+
+    def test_inactive_objects_are_not_served(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.speaker.is_active = False
+            self.speaker.save()
+
+        self.assertEqual(self.get(self.speaker).status_code, 404)
+
+    def test_stats_command(self):
+        self.get(self.speaker), self.get(self.speaker)
+        stdout = StringIO()
+
+        call_command('object_cache_stats', reset=True, stdout=stdout)
+
+        self.assertIn('Hit ratio 50.0% over 2 requests', stdout.getvalue())
+        self.assertEqual(object_cache.get_stats(), {'HIT-LOCAL': 0, 'HIT': 0, 'MISS': 0})
+
+
+class ProcessLocalObjectCacheTests(CatalogTestCase):
+    def test_writes_in_other_processes_invalidate_entries(self):
+        product = make_product(Category.objects.create(name='Audio'), Brand.objects.create(name='Acme'), 'Speaker')
+        url = f'/api/products/{product.slug}/'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT-LOCAL')
+
+        # Another process saved the product: its invalidation never reached this process's cache
+        Product.objects.filter(pk=product.pk).update(price=90)
+        CatalogVersion.objects.update(version=F('version') + 1)
+
+        response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], response.json()['price']), ('MISS', '90.00'))
+
+
+class CacheCoalescingTests(SimpleTestCase):
+    """cache_catalog_response around a view that blocks until released; the catalog version is fixed per test"""
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.version = 1
+        patcher = mock.patch.object(catalog_cache, 'get_catalog_version', lambda: self.version)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls, self.started, self.release = [], threading.Event(), threading.Event()
+        self.release.set()
+
+        @api_view(['GET'])
+        @permission_classes([AllowAny])
+        @cache_catalog_response
+        def view(request):
+            self.calls.append(self.version)
+            self.started.set()
+            self.release.wait(5)
+            return Response({'version': self.version}, status=int(request.query_params.get('status', 200)))
+
+        self.view = view
+        self.factory = APIRequestFactory()
+
+    def get(self, **params):
+        return self.view(self.factory.get('/api/test/', params))
+
+    def in_threads(self, count):
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.get())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, responses
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+        self.version = 2
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_errors_are_not_cached(self):
+        self.get(status=404)
+        self.get(status=404)
+
+        self.assertEqual(len(self.calls), 2)
+
+    def test_concurrent_misses_compute_once(self):
+        self.release.clear()
+        threads, responses = self.in_threads(5)
+        self.started.wait(5)
+        # Let the other threads reach the leader's Event
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(sorted(response['X-Cache'] for response in responses), ['HIT'] * 4 + ['MISS'])
+
+    def test_waiters_get_stale_data_while_the_leader_recomputes(self):
+        self.get()
+        self.version = 2
+        self.release.clear()
+        threads, responses = self.in_threads(1)
+        self.started.wait(5)
+
+        stale = self.get()
+        self.release.set()
+        threads[0].join()
+
+        self.assertEqual((stale['X-Cache'], stale.data, stale['ETag']), ('STALE', {'version': 1}, 'W/"stale-1"'))
+        self.assertEqual(responses[0]['X-Cache'], 'MISS')
+        self.assertEqual(self.get().data, {'version': 2})
+
+    @override_settings(CATALOG_CACHE_LOCK_TIMEOUT=0.2)
+    def test_another_process_holding_the_lock(self):
+        request = Request(self.factory.get('/api/test/'))
+        lock_key = f'{catalog_cache.catalog_cache_key(request, 1)}:lock'
+        caches['catalog'].add(lock_key, 1, 10)
+
+        # Without stale data to serve, it polls for the other process's result, then computes it itself
+        response = self.get()
+
+        self.assertEqual((response['X-Cache'], self.calls), ('MISS', [1]))
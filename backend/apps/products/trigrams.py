@@ -0,0 +1,109 @@
+"""
+Typo-tolerant product search over an in-process trigram index.
+
+The vocabulary is every distinct word of active product names and their
+brand names; each word has a posting list of the products it appears in.
+A query word is compared with vocabulary words by trigram similarity
+(|A ∩ B| / |A ∪ B| over pg_trgm-style padded trigrams), so "samsnug" still
+reaches "samsung" (similarity 0.33).
+
+Candidate words are pruned before any similarity is computed. A word can
+only reach THRESHOLD if it shares at least ceil(THRESHOLD * n) of the
+query's n trigrams, so it must contain one of the n - ceil(THRESHOLD * n) + 1
+rarest query trigrams. Only those posting lists are read, and words whose
+length rules out the threshold are skipped. Products are scored by the mean,
+over query words, of their best matching word's similarity.
+"""
+import heapq
+import math
+from array import array
+from collections import defaultdict
+from django.db.models import Case, FloatField, Value, When
+from .local_index import LocalIndex, normalize
+from .models import Product
+
+THRESHOLD = 0.3
+MAX_WORDS_PER_TOKEN = 10
+MAX_RESULTS = 200
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex:
+    def __init__(self):
+        word_ids = {}
+        products = defaultdict(list)
+        rows = Product.objects.filter(is_active=True).values_list('id', 'name', 'brand__name').iterator(chunk_size=5000)
+        for pk, name, brand in rows:
+            for word in set(normalize(f'{name} {brand}').split()):
+                products[word_ids.setdefault(word, len(word_ids))].append(pk)
+
+        self.words = list(word_ids)
+        self.products = [array('L', products[i]) for i in range(len(self.words))]
+        self.sizes = array('H', [len(trigrams(word)) for word in self.words])
+        postings = defaultdict(list)
+        for i, word in enumerate(self.words):
+            for trigram in trigrams(word):
+                postings[trigram].append(i)
+        self.postings = {trigram: array('L', ids) for trigram, ids in postings.items()}
+
+    def similar_words(self, token):
+        """[(similarity, word id)] of the best vocabulary matches for one query word"""
+        query = trigrams(token)
+        n = len(query)
+        needed = math.ceil(THRESHOLD * n)
+        rarest = sorted(query, key=lambda trigram: len(self.postings.get(trigram, ())))[:n - needed + 1]
+
+        candidates = set()
+        for trigram in rarest:
+            candidates.update(self.postings.get(trigram, ()))
+        matches = []
+        for i in candidates:
+            if not THRESHOLD * n <= self.sizes[i] <= n / THRESHOLD:
+                continue
+            score = similarity(query, trigrams(self.words[i]))
+            if score >= THRESHOLD:
+                matches.append((score, i))
+        return heapq.nlargest(MAX_WORDS_PER_TOKEN, matches)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """[(product id, score)] for the products best matching query, best first"""
+        tokens = normalize(query).split()
+        if not tokens:
+            return []
+        scores = defaultdict(float)
+        for token in tokens:
+            # Best similarity per product: apply words in ascending order so better ones overwrite
+            best = {}
+            for score, i in reversed(self.similar_words(token)):
+                best.update(dict.fromkeys(self.products[i], score / len(tokens)))
+            if not scores:
+                scores.update(best)
+                continue
+            for pk, score in best.items():
+                scores[pk] += score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+trigram_index = LocalIndex(TrigramIndex, 'trigram-index')
+
+
+def fuzzy_search(queryset, query):
+    """
+    Filter queryset to the products closest to query by trigram similarity,
+    annotated with `search_rank` like the full-text search.
+    """
+    matches = trigram_index.get().search(query)
+    if not matches:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+    return queryset.filter(id__in=[pk for pk, _ in matches]).annotate(search_rank=Case(
+        *[When(id=pk, then=Value(score)) for pk, score in matches], output_field=FloatField()
+    ))
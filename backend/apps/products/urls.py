@@ -8,7 +8,10 @@ urlpatterns = [
     path('brands/', views.BrandListView.as_view(), name='brands'),
     path('products/', views.ProductListView.as_view(), name='products'),
     path('products/<slug:slug>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('products/<slug:slug>/related/', views.related_products, name='product-related'),
     path('featured/', views.FeaturedProductsView.as_view(), name='featured-products'),
     path('filters/', views.product_filters, name='product-filters'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('category/<slug:category_slug>/products/', views.category_products, name='category-products'),
+    path('feeds/products.<str:feed_format>', views.product_feed, name='product-feed'),
 ]
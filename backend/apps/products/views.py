@@ -1,30 +1,105 @@
-from rest_framework import generics, filters, status
+import logging
+from decimal import Decimal, InvalidOperation
+from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count
+from collections import defaultdict
+from django.http import Http404, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from . import object_cache
+from .attributes import AttributeFilterBackend
+from .autocomplete import autocomplete_index
+from .cache import cache_catalog_response
+from .cards import ProductCardListMixin, card_queryset, product_card
+from .conditional import category_condition, collection_condition, product_condition
 from .models import Category, Brand, Product
+from .facets import get_facets
+from .feeds import FEED_FORMATS, encode_chunks, feed_items, feed_queryset, parse_since, render_feed
+from .fieldsets import PRODUCT_DETAIL_PLAN, PRODUCT_LIST_PLAN, apply_plan
+from .pagination import CatalogPagination
+from .recommendations import DEFAULT_TOP_K
+from .search import FuzzySearchFilter, SearchRankOrderingFilter, search_products
 from .serializers import (
     CategorySerializer, CategoryTreeSerializer, BrandSerializer,
     ProductListSerializer, ProductDetailSerializer
 )
-from django.db.models import Count, Q, Min, Max  # Add Min, Max here
 
+logger = logging.getLogger(__name__)
+
+
+def price_param(params, name):
+    """The decimal value of a price query parameter, None if absent; 400 if it is not a number"""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite():
+        raise ValidationError({name: 'A valid number is required.'})
+    return price
+
+
+@method_decorator([collection_condition, cache_catalog_response], name='list')
 class CategoryTreeView(generics.ListAPIView):
-    """Get hierarchical category tree"""
+    """
+    Get hierarchical category tree.
+
+    All active categories are loaded in one query and assembled in memory;
+    product counts come from the stored counters. Pass `max_depth` to limit how many levels
+    are returned (1 = top-level categories only).
+    """
     serializer_class = CategoryTreeSerializer
     permission_classes = [AllowAny]
-    
+
+    def get_max_depth(self):
+        try:
+            max_depth = int(self.request.query_params.get('max_depth', ''))
+        except ValueError:
+            return None
+        return max_depth if max_depth > 0 else None
+
     def get_queryset(self):
-        return Category.objects.filter(parent__isnull=True, is_active=True).order_by('sort_order', 'name')
+        queryset = Category.objects.filter(is_active=True).order_by('sort_order', 'name')
+        max_depth = self.get_max_depth()
+        if max_depth:
+            queryset = queryset.filter(
+                ancestor_links__ancestor__parent__isnull=True,
+                ancestor_links__depth__lt=max_depth
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        roots = []
+        tree_children = defaultdict(list)
+        for category in self.get_queryset():
+            if category.parent_id is None:
+                roots.append(category)
+            else:
+                tree_children[category.parent_id].append(category)
+
+        context = self.get_serializer_context()
+        context['tree_children'] = tree_children
 
+        page = self.paginate_queryset(roots)
+        if page is not None:
+            serializer = self.get_serializer_class()(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer_class()(roots, many=True, context=context)
+        return Response(serializer.data)
+
+@method_decorator([collection_condition, cache_catalog_response], name='list')
 class CategoryListView(generics.ListAPIView):
     """Get flat list of all categories"""
     queryset = Category.objects.filter(is_active=True).order_by('sort_order', 'name')
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
+@method_decorator(category_condition, name='retrieve')
 class CategoryDetailView(generics.RetrieveAPIView):
     """Get category details by slug"""
     queryset = Category.objects.filter(is_active=True)
@@ -32,22 +107,41 @@ class CategoryDetailView(generics.RetrieveAPIView):
     permission_classes = [AllowAny]
     lookup_field = 'slug'
 
+    def retrieve(self, request, *args, **kwargs):
+        if not object_cache.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        entry, cached_status = object_cache.get_category(request, kwargs['slug'])
+        object_cache.record(cached_status)
+        if entry is None or not entry['is_active']:
+            raise Http404
+        response = Response(entry['data'])
+        response['X-Cache'] = cached_status
+        return response
+
+@method_decorator([collection_condition, cache_catalog_response], name='list')
 class BrandListView(generics.ListAPIView):
     queryset = Brand.objects.filter(is_active=True).order_by('name')
     serializer_class = BrandSerializer
     permission_classes = [AllowAny]
 
-class ProductListView(generics.ListAPIView):
+@method_decorator(collection_condition, name='list')
+class ProductListView(ProductCardListMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FuzzySearchFilter, AttributeFilterBackend, SearchRankOrderingFilter]
     filterset_fields = ['category', 'brand', 'featured']
     search_fields = ['name', 'description', 'short_description']
-    ordering_fields = ['price', 'created_at', 'name']
+    ordering_fields = ['price', 'created_at', 'name', 'popularity']
     ordering = ['-created_at']
+    pagination_class = CatalogPagination
     
     def get_queryset(self):
         queryset = Product.objects.filter(is_active=True)
+
+        # Full-text search, ranked by relevance, with a typo-tolerant fallback
+        query = self.request.query_params.get('q', '').strip()
+        if query:
+            queryset = search_products(queryset, query, fuzzy=True)
         
         # Category filtering with subcategories
         category_slug = self.request.query_params.get('category_slug', None)
@@ -55,8 +149,7 @@ class ProductListView(generics.ListAPIView):
             try:
                 category = Category.objects.get(slug=category_slug, is_active=True)
                 # Include products from current category and all subcategories
-                all_categories = [category.id] + [cat.id for cat in category.get_all_children()]
-                queryset = queryset.filter(category_id__in=all_categories)
+                queryset = queryset.filter(category__ancestor_links__ancestor=category)
             except Category.DoesNotExist:
                 pass
         
@@ -66,11 +159,11 @@ class ProductListView(generics.ListAPIView):
             queryset = queryset.filter(brand__slug=brand_slug)
         
         # Price range filtering
-        min_price = self.request.query_params.get('min_price', None)
-        max_price = self.request.query_params.get('max_price', None)
-        if min_price:
+        min_price = price_param(self.request.query_params, 'min_price')
+        max_price = price_param(self.request.query_params, 'max_price')
+        if min_price is not None:
             queryset = queryset.filter(price__gte=min_price)
-        if max_price:
+        if max_price is not None:
             queryset = queryset.filter(price__lte=max_price)
         
         # Stock availability
@@ -78,62 +171,85 @@ class ProductListView(generics.ListAPIView):
         if in_stock == 'true':
             queryset = queryset.filter(stock_quantity__gt=0)
         
-        return queryset.select_related('category', 'brand').prefetch_related('images')
+        return apply_plan(queryset, self.request, PRODUCT_LIST_PLAN)
 
+@method_decorator(product_condition, name='retrieve')
 class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductDetailSerializer
     permission_classes = [AllowAny]
     lookup_field = 'slug'
 
-class FeaturedProductsView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_active=True, featured=True).select_related('category', 'brand').prefetch_related('images')
+    def get_queryset(self):
+        return apply_plan(Product.objects.filter(is_active=True), self.request, PRODUCT_DETAIL_PLAN)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not object_cache.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        data, cached_status = object_cache.get_product(request, kwargs['slug'])
+        object_cache.record(cached_status)
+        if data is None:
+            raise Http404
+        response = Response(data)
+        response['X-Cache'] = cached_status
+        return response
+
+@method_decorator([collection_condition, cache_catalog_response], name='list')
+class FeaturedProductsView(ProductCardListMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
 
+    def get_queryset(self):
+        return apply_plan(Product.objects.filter(is_active=True, featured=True), self.request, PRODUCT_LIST_PLAN)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@collection_condition
+@cache_catalog_response
 def product_filters(request):
-    """Get filter options for products"""
+    """
+    Get filter options for products.
+
+    Accepts the same query parameters as ProductListView and returns facet
+    counts for the matching result set.
+    """
     try:
-        # Categories with product count
-        categories = Category.objects.filter(is_active=True).annotate(
-            product_count=Count('products', filter=Q(products__is_active=True))
-        ).filter(product_count__gt=0).order_by('name')
-        
-        # Brands with product count
-        brands = Brand.objects.filter(is_active=True).annotate(
-            product_count=Count('products', filter=Q(products__is_active=True))
-        ).filter(product_count__gt=0).order_by('name')
-        
-        # Price range
-        price_range = Product.objects.filter(is_active=True).aggregate(
-            min_price=Min('price'),
-            max_price=Max('price')
-        )
-        
-        # Handle case where no products exist
-        if price_range['min_price'] is None:
-            price_range = {'min_price': 0, 'max_price': 0}
-        
-        return Response({
-            'categories': CategorySerializer(categories, many=True).data,
-            'brands': BrandSerializer(brands, many=True).data,
-            'price_range': price_range
-        })
-        
+        view = ProductListView()
+        view.setup(request)
+        view.request = request
+        view.format_kwarg = None
+
+        def get_queryset():
+            # attr[...] filters are applied by compute_facets (disjunctive attribute facets)
+            queryset = view.get_queryset()
+            for backend in view.filter_backends:
+                if backend is not AttributeFilterBackend:
+                    queryset = backend().filter_queryset(request, queryset, view)
+            return queryset
+
+        return Response(get_facets(request.query_params, get_queryset))
+
+    except ValidationError:
+        raise
     except Exception as e:
-        print(f"Error in product_filters: {e}")
-        return Response({
+        logger.exception('Could not compute product filters')
+        response = Response({
             'categories': [],
             'brands': [],
             'price_range': {'min_price': 0, 'max_price': 0},
+            'price_buckets': [],
+            'availability': {'in_stock': 0, 'out_of_stock': 0},
+            'attributes': [],
+            'total': 0,
             'error': str(e)
         })
+        # Keep the fallback out of the response cache and client caches
+        response['Cache-Control'] = 'no-store'
+        return response
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@collection_condition
 def category_products(request, category_slug):
     """Get products for a specific category"""
     try:
@@ -142,22 +258,20 @@ def category_products(request, category_slug):
         return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Get products from current category and all subcategories
-    all_categories = [category.id] + [cat.id for cat in category.get_all_children()]
-    products = Product.objects.filter(
-        category_id__in=all_categories,
+    products = category.get_products().filter(
         is_active=True
-    ).select_related('category', 'brand').prefetch_related('images')
+    ).select_related('category__parent', 'brand').prefetch_related('images')
     
     # Apply additional filters
     brand_slug = request.query_params.get('brand_slug', None)
     if brand_slug:
         products = products.filter(brand__slug=brand_slug)
     
-    min_price = request.query_params.get('min_price', None)
-    max_price = request.query_params.get('max_price', None)
-    if min_price:
+    min_price = price_param(request.query_params, 'min_price')
+    max_price = price_param(request.query_params, 'max_price')
+    if min_price is not None:
         products = products.filter(price__gte=min_price)
-    if max_price:
+    if max_price is not None:
         products = products.filter(price__lte=max_price)
     
     # Ordering
@@ -165,9 +279,7 @@ def category_products(request, category_slug):
     products = products.order_by(ordering)
     
     # Pagination
-    from rest_framework.pagination import PageNumberPagination
-    paginator = PageNumberPagination()
-    paginator.page_size = 20
+    paginator = CatalogPagination()
     result_page = paginator.paginate_queryset(products, request)
     
     serializer = ProductListSerializer(result_page, many=True)
@@ -175,3 +287,69 @@ def category_products(request, category_slug):
         'category': CategorySerializer(category).data,
         'products': serializer.data
     })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete(request):
+    """
+    Search-as-you-type suggestions for `q`: matching products, brands and
+    categories from the in-process prefix index, up to `limit` (default 5) of each.
+    """
+    try:
+        limit = int(request.query_params.get('limit', 5))
+    except ValueError:
+        limit = 5
+    return Response(autocomplete_index.get().suggest(request.query_params.get('q', ''), limit))
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@collection_condition
+@cache_catalog_response
+def related_products(request, slug):
+    """
+    Frequently bought together: product cards ranked by how often they were
+    ordered with this product (see recommendations.py). `limit` caps the list.
+    """
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', DEFAULT_TOP_K)), 50))
+    except ValueError:
+        limit = DEFAULT_TOP_K
+    related = Product.objects.filter(
+        is_active=True, related_from__product__slug=slug, related_from__product__is_active=True
+    ).order_by('related_from__rank')
+    cards = [product_card(row, request) for row in card_queryset(related)[:limit]]
+    if not cards and not Product.objects.filter(slug=slug, is_active=True).exists():
+        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'results': cards})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_feed(request, feed_format):
+    """
+    Stream the product feed as Google Merchant-style XML or CSV.
+
+    `since` (ISO date or datetime) limits it to products changed after that
+    moment; `gzip=true` returns a gzip-compressed file.
+    """
+    if feed_format not in FEED_FORMATS:
+        raise Http404
+    since = None
+    if request.query_params.get('since'):
+        try:
+            since = parse_since(request.query_params['since'])
+        except ValueError as e:
+            return Response({'since': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+    compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    base_url = request.build_absolute_uri('/')
+    items = feed_items(feed_queryset(since), base_url=base_url)
+    chunks = render_feed(feed_format, items, link=base_url)
+    content_type = 'application/xml; charset=utf-8' if feed_format == 'xml' else 'text/csv; charset=utf-8'
+    filename = f'products.{feed_format}'
+    if compress:
+        content_type, filename = 'application/gzip', f'{filename}.gz'
+
+    response = StreamingHttpResponse(encode_chunks(chunks, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from apps.products import object_cache
+from apps.products.cache import bump_catalog_version_on_commit
+from apps.products.models import Product
+from apps.reviews.models import Review
+
+STARS = range(1, 6)
+RATING_FIELDS = ['rating_sum', 'review_count'] + [f'rating_{star}_count' for star in STARS]
+
+
+def aggregate_ratings():
+    """Per-product review aggregates computed with a single GROUP BY"""
+    return Review.objects.values('product_id').annotate(
+        rating_sum=Sum('rating'),
+        review_count=Count('id'),
+        **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in STARS}
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized review aggregates stored on Product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Product.objects.exclude(**{field: 0 for field in RATING_FIELDS}).update(**{field: 0 for field in RATING_FIELDS})
+            products = [
+                Product(id=row['product_id'], **{field: row[field] for field in RATING_FIELDS})
+                for row in aggregate_ratings()
+            ]
+            Product.objects.bulk_update(products, RATING_FIELDS, batch_size=options['batch_size'])
+            object_cache.invalidate_all()
+            bump_catalog_version_on_commit()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled ratings for {len(products)} products'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:26
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def backfill_product_ratings(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('reviews', 'Review')
+    fields = ['rating_sum', 'review_count'] + [f'rating_{star}_count' for star in range(1, 6)]
+    rows = Review.objects.values('product_id').annotate(
+        rating_sum=Sum('rating'),
+        review_count=Count('id'),
+        **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in range(1, 6)}
+    )
+    products = [Product(id=row['product_id'], **{field: row[field] for field in fields}) for row in rows]
+    Product.objects.bulk_update(products, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+        ('products', '0004_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_ratings, migrations.RunPython.noop),
+    ]
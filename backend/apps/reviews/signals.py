@@ -0,0 +1,46 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from apps.products import object_cache
+from apps.products.cache import bump_catalog_version_on_commit
+from apps.products.models import Product
+from .models import Review
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None:
+        Product.apply_rating_change(instance.product_id, new_rating=instance.rating)
+        return
+
+    old_product_id, old_rating = previous
+    if old_product_id == instance.product_id:
+        if old_rating != instance.rating:
+            Product.apply_rating_change(instance.product_id, old_rating, instance.rating)
+    else:
+        Product.apply_rating_change(old_product_id, old_rating=old_rating)
+        Product.apply_rating_change(instance.product_id, new_rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    Product.apply_rating_change(instance.product_id, old_rating=instance.rating)
+
+
+# Ratings are part of the cached catalog payloads
+post_save.connect(bump_catalog_version_on_commit, sender=Review, dispatch_uid='catalog_version_save_Review')
+post_delete.connect(bump_catalog_version_on_commit, sender=Review, dispatch_uid='catalog_version_delete_Review')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_product(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    object_cache.invalidate_products(pk__in=[instance.product_id, previous and previous[0]])
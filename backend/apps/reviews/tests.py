@@ -1,3 +1,71 @@
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from apps.authentication.models import User
+from apps.products.cache import get_catalog_version
+from apps.products.models import Brand, Category, Product
+from .models import Review
 
-# Create your tests here.
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Audio')
+        brand = Brand.objects.create(name='Acme')
+        self.product = Product.objects.create(name='Speaker', description='-', price=100, category=category, brand=brand)
+        self.other = Product.objects.create(name='Amp', description='-', price=100, category=category, brand=brand)
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(3)
+        ]
+
+    def review(self, user, rating, product=None):
+        return Review.objects.create(user=user, product=product or self.product, rating=rating, title='t', comment='c')
+
+    def aggregates(self, product=None):
+        product = Product.objects.get(pk=(product or self.product).pk)
+        return product.review_count, product.rating_sum, product.rating_histogram, product.average_rating
+
+    def test_create_updates_aggregates(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+
+        self.assertEqual(self.aggregates(), (2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}, 3.5))
+
+    def test_rating_change_moves_between_buckets(self):
+        review = self.review(self.users[0], 5)
+        review.rating = 3
+        review.save()
+
+        self.assertEqual(self.aggregates(), (1, 3, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0}, 3))
+
+    def test_moving_a_review_to_another_product(self):
+        review = self.review(self.users[0], 4)
+        review.product = self.other
+        review.save()
+
+        self.assertEqual(self.aggregates()[:2], (0, 0))
+        self.assertEqual(self.aggregates(self.other)[:2], (1, 4))
+
+    def test_delete_updates_aggregates(self):
+        review = self.review(self.users[0], 4)
+        self.review(self.users[1], 2)
+        review.delete()
+
+        self.assertEqual(self.aggregates(), (1, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}, 2))
+
+    def test_bulk_delete_drift_is_clamped_and_reconciled(self):
+        review = self.review(self.users[0], 2)
+        # Drift, e.g. from a bulk write that bypassed the signals, must not make a delete fail
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=0, review_count=0, rating_2_count=0)
+        review.delete()
+        self.assertEqual(self.aggregates()[:2], (0, 0))
+
+        self.review(self.users[2], 5)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=99, review_count=7)
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_product_ratings', stdout=StringIO())
+
+        self.assertEqual(self.aggregates(), (1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1}, 5))
+        # Cached list responses show average_rating
+        self.assertGreater(get_catalog_version(), version)
@@ -0,0 +1,85 @@
+"""
+Read-replica routing.
+
+ReplicaRoutingMiddleware picks one database from REPLICA_DATABASES at random
+for each safe-method request (GET, HEAD, OPTIONS); during that request
+ReplicaRouter sends reads of models in REPLICA_APPS to it, so every query of
+the request sees the same point in replication. All writes, all other apps,
+REPLICA_EXCLUDED_MODELS and anything outside a request (management commands,
+background threads) use `default`.
+
+After an unsafe request the client gets a short-lived cookie that sticks it
+to `default` for REPLICA_STICKY_SECONDS, so it reads its own writes despite
+replication lag. The cookie is the only state, so every process honours it.
+Without REPLICA_DATABASES the middleware does nothing.
+
+The catalog version is always read from `default`; caches that label data
+with it check that the request's replica has caught up first (see
+apps.products.cache.replica_is_current).
+"""
+import random
+from contextvars import ContextVar
+from django.conf import settings
+
+STICKY_COOKIE = 'db_primary'
+
+_replica = ContextVar('replica', default=None)
+
+
+def current_replica():
+    """The replica reads of the current request go to, or None"""
+    return _replica.get()
+
+
+def is_sticky(request):
+    return STICKY_COOKIE in request.COOKIES
+
+
+def stick_to_primary(response):
+    window = settings.REPLICA_STICKY_SECONDS
+    if window > 0:
+        response.set_cookie(STICKY_COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        replica = random.choice(settings.REPLICA_DATABASES) if safe and not is_sticky(request) else None
+        token = _replica.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        if not safe and response.status_code < 400:
+            stick_to_primary(response)
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica is None or model._meta.label in settings.REPLICA_EXCLUDED_MODELS:
+            return 'default'
+        if model._meta.app_label in settings.REPLICA_APPS:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas receive their schema through replication
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +54,7 @@ AUTH_USER_MODEL = 'apps.authentication.User'
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'ecommerce_project.replicas.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,9 +91,61 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than in-memory SQLite, so tests can use several connections (apps/cart/tests.py)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replicas
+# Safe-method (GET/HEAD/OPTIONS) requests read the apps in REPLICA_APPS from a
+# replica; everything else uses `default` (see ecommerce_project/replicas.py).
+# A client that just wrote sticks to `default` for REPLICA_STICKY_SECONDS.
+# To try it locally with two SQLite files:
+#   cp db.sqlite3 replica.sqlite3
+#   DATABASE_REPLICAS=replica.sqlite3 python manage.py runserver
+REPLICA_DATABASES = []
+for number, name in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['ecommerce_project.replicas.ReplicaRouter']
+REPLICA_APPS = ['products', 'reviews']
+# Cached catalog data is stored under the catalog version, so the version must
+# never be newer than the data it labels: read it from `default` only
+REPLICA_EXCLUDED_MODELS = ['products.CatalogVersion']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+
+# Cache
+# The `catalog` cache holds versioned responses of the public catalog endpoints
+# (see apps/products/cache.py). Point it at a shared backend in production, e.g.
+#   CATALOG_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   CATALOG_CACHE_LOCATION=/var/tmp/catalog_cache
+# or
+#   CATALOG_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CATALOG_CACHE_LOCATION=redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='catalog'),
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+    },
+}
+
+# Concurrent misses on a catalog response are computed once (apps/products/cache.py).
+# Other requests wait up to CATALOG_CACHE_LOCK_TIMEOUT seconds for the result, or get
+# the previous data if it expired at most CATALOG_CACHE_STALE_SECONDS ago.
+CATALOG_CACHE_LOCK_TIMEOUT = 10
+CATALOG_CACHE_STALE_SECONDS = config('CATALOG_CACHE_STALE_SECONDS', default=60, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,6 +202,21 @@ CORS_ALLOW_CREDENTIALS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Thumbnails and WebP renditions of uploaded catalog images (apps/products/images.py)
+IMAGE_PIPELINE_WORKERS = 2
+IMAGE_PIPELINE_SYNC = False
+
+# Partner product feeds (apps/products/feeds.py); {slug} is replaced with the product slug
+PRODUCT_FEED_LINK = config('PRODUCT_FEED_LINK', default='http://localhost:3000/products/{slug}')
+PRODUCT_FEED_CURRENCY = 'INR'
+PRODUCT_FEED_CHUNK_SIZE = 2000
+
+# Entries in the in-process tier of the product/category detail object cache (apps/products/object_cache.py)
+OBJECT_CACHE_LOCAL_SIZE = config('OBJECT_CACHE_LOCAL_SIZE', default=1000, cast=int)
+
+# Minimum age of the in-process autocomplete and fuzzy search indexes before a catalog change rebuilds them
+LOCAL_INDEX_REFRESH_SECONDS = 30
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 